@@ -0,0 +1,171 @@
+"""Throughput benchmarks for the deletion engine against fake_discord.py.
+
+Runs DeleteEngine, the code behind MessageDeleteWorker and cli.py, through
+channel, guild and multi-guild scenarios at several history sizes, and
+reports deletes per second, requests per deletion and wall time. Save a run
+with --output and check later changes against it with --compare; a slower
+rate or more requests per deletion than the tolerance allows exits with 1.
+
+    python benchmark.py
+    python benchmark.py --sizes 300 3000 --output bench.json
+    python benchmark.py --compare bench.json
+    python benchmark.py --archive   # same runs with the message archive on
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import engine
+from fake_discord import FakeDiscord, DEFAULT_LIMITS, USER_ID
+
+SCENARIOS = {
+    "channel": {"guilds": 1, "channels": 1, "dms": 0},
+    "guild": {"guilds": 1, "channels": 4, "dms": 0},
+    "multi-guild": {"guilds": 3, "channels": 2, "dms": 2},
+}
+DEFAULT_SIZES = (150, 600)
+DEFAULT_TIME_SCALE = 4.0
+ARCHIVE_ATTACHMENT_EVERY = 4
+REGRESSION_TOLERANCE = 0.15
+
+
+def scaled_limits(time_scale):
+    # Same bucket sizes, shorter windows, so runs take seconds
+    return {route: (limit, window / time_scale) for route, (limit, window) in DEFAULT_LIMITS.items()}
+
+
+def run_scenario(name, size, use_search=True, concurrency=engine.DEFAULT_CHANNEL_CONCURRENCY,
+                 latency=0.0, time_scale=DEFAULT_TIME_SCALE, archive=False, verbose=False):
+    fake = FakeDiscord(messages=size, latency=latency, limits=scaled_limits(time_scale),
+                       attachment_every=ARCHIVE_ATTACHMENT_EVERY if archive else 0, **SCENARIOS[name])
+    server = fake.serve()
+    expected = fake.my_message_count()
+    guild_ids = list(fake.guilds)
+    first_channel = fake.guilds[guild_ids[0]]['channels'][0]['id']
+
+    api_base = engine.DISCORD_API_BASE
+    engine.DISCORD_API_BASE = server.api_base
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            if name == "channel":
+                target = {"channel_id": first_channel, "guild_id": guild_ids[0]}
+            else:
+                target = {"guild_ids": guild_ids, "include_dms": bool(fake.dm_channels)}
+            deleter = engine.DeleteEngine(
+                "benchmark-token",
+                user_id=USER_ID,
+                concurrency=concurrency,
+                use_search=use_search,
+                checkpoint_path=os.path.join(tmp, "checkpoint.db"),
+                cache_path=os.path.join(tmp, "cache.db"),
+                archive_path=os.path.join(tmp, "archive.jsonl.gz") if archive else None,
+                archive_attachments=archive,
+                on_status=print if verbose else None,
+                **target
+            )
+            started = time.monotonic()
+            deleted = deleter.run()
+            wall = time.monotonic() - started
+    finally:
+        engine.DISCORD_API_BASE = api_base
+        server.shutdown()
+        server.server_close()
+
+    stats = fake.stats()
+    return {
+        "scenario": name,
+        "size": size,
+        "search": use_search,
+        "archive": archive,
+        "expected": expected,
+        "deleted": deleted,
+        "wall": round(wall, 3),
+        "rate": round(deleted / wall, 2) if wall else 0.0,
+        "requests": stats['requests'],
+        "requests_per_delete": round(stats['requests'] / deleted, 3) if deleted else None,
+        "rate_limited": stats['rate_limited'],
+        "sleep_time": deleter.last_metrics['sleep_time'],
+        "http_time": deleter.last_metrics['http_time'],
+    }
+
+
+def print_results(results):
+    print(f"{'scenario':<12} {'size':>6} {'search':>6} {'deleted':>9} {'wall s':>8} "
+          f"{'msg/s':>7} {'req/del':>7} {'429s':>5}")
+    for r in results:
+        deleted = f"{r['deleted']}/{r['expected']}"
+        per_delete = f"{r['requests_per_delete']:.2f}" if r['requests_per_delete'] is not None else "-"
+        print(f"{r['scenario']:<12} {r['size']:>6} {'yes' if r['search'] else 'no':>6} {deleted:>9} "
+              f"{r['wall']:>8.2f} {r['rate']:>7.2f} {per_delete:>7} {r['rate_limited']:>5}")
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Returns one line per result that regressed against the baseline."""
+    previous = {(r['scenario'], r['size'], r['search'], r.get('archive', False)): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r['scenario'], r['size'], r['search'], r['archive']))
+        if old is None:
+            continue
+        label = f"{r['scenario']} size={r['size']} search={'yes' if r['search'] else 'no'}"
+        if r['deleted'] < r['expected']:
+            regressions.append(f"{label}: deleted {r['deleted']} of {r['expected']}")
+        if r['rate'] < old['rate'] * (1 - tolerance):
+            regressions.append(f"{label}: {r['rate']:.2f} msg/s, was {old['rate']:.2f}")
+        if (r['requests_per_delete'] and old['requests_per_delete']
+                and r['requests_per_delete'] > old['requests_per_delete'] * (1 + tolerance)):
+            regressions.append(
+                f"{label}: {r['requests_per_delete']:.2f} requests per delete, was {old['requests_per_delete']:.2f}"
+            )
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the deletion engine against a local fake Discord API.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="messages per channel")
+    parser.add_argument("--no-search", action="store_true", help="benchmark the history scan instead of search")
+    parser.add_argument("--archive", action="store_true",
+                        help="archive messages and download attachments while deleting")
+    parser.add_argument("--concurrency", type=int, default=engine.DEFAULT_CHANNEL_CONCURRENCY)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake API response")
+    parser.add_argument("--time-scale", type=float, default=DEFAULT_TIME_SCALE,
+                        help="how much faster the fake rate-limit windows reset than the defaults")
+    parser.add_argument("--output", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="fail if results regress against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument("--verbose", action="store_true", help="print the engine's status lines")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        for size in args.sizes:
+            results.append(run_scenario(
+                name, size, use_search=not args.no_search, concurrency=args.concurrency,
+                latency=args.latency, time_scale=args.time_scale, archive=args.archive, verbose=args.verbose
+            ))
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
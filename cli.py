@@ -0,0 +1,157 @@
+"""Headless front end for the deletion engine.
+
+Reads the token from DISCORD_TOKEN and writes one JSON object per line to
+stdout, so runs can be scripted or scheduled without starting Qt.
+
+    DISCORD_TOKEN=... python cli.py --guild 1234
+    DISCORD_TOKEN=... python cli.py --guild 1234 --channel 5678
+    DISCORD_TOKEN=... python cli.py --guild 1234 --before 2021-01-01 --dry-run
+    DISCORD_TOKEN=... python cli.py --all-guilds --dms
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+from engine import (
+    DeleteEngine, DiscordClient, MessageFilter,
+    DEFAULT_CHANNEL_CONCURRENCY, DEFAULT_HISTORY_SHARDS, CHECKPOINT_PATH, CACHE_PATH, ARCHIVE_PATH
+)
+
+
+class JsonLinesReporter:
+    def __init__(self, stream=sys.stdout):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        record = {"event": event, "time": round(time.time(), 3), **fields}
+        with self._lock:
+            self.stream.write(json.dumps(record) + "\n")
+            self.stream.flush()
+
+    def status(self, message):
+        self.emit("status", message=message)
+
+    def metrics(self, metrics):
+        self.emit("metrics", **metrics)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Delete your own Discord messages without the GUI.")
+    parser.add_argument("--guild", action="append", default=[],
+                        help="guild id; without --channel every channel and thread in it is purged (repeatable)")
+    parser.add_argument("--all-guilds", action="store_true", help="purge every guild the account is in")
+    parser.add_argument("--dms", action="store_true", help="also purge open DM and group DM channels")
+    parser.add_argument("--channel", help="only purge this channel")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CHANNEL_CONCURRENCY,
+                        help="channels worked on at once in a guild purge")
+    parser.add_argument("--history-shards", type=int, default=DEFAULT_HISTORY_SHARDS,
+                        help="parallel snowflake-range cursors per channel history scan")
+    parser.add_argument("--no-search", action="store_true", help="scan channel history instead of using search")
+    parser.add_argument("--no-threads", action="store_true", help="skip threads and forum posts in a guild purge")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint of an earlier run")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="checkpoint database path")
+    parser.add_argument("--cache", default=CACHE_PATH, help="message cache database path")
+    parser.add_argument("--metrics", metavar="PATH", help="write the run's final metrics to this JSON file")
+    parser.add_argument("--archive", nargs="?", const=ARCHIVE_PATH, metavar="PATH",
+                        help=f"save every matching message to a .jsonl.gz file before deleting it (default: {ARCHIVE_PATH})")
+    parser.add_argument("--archive-attachments", action="store_true",
+                        help="also download the archived messages' attachments next to the archive")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted and how long it takes")
+
+    filters = parser.add_argument_group("filters")
+    filters.add_argument("--after", type=datetime.fromisoformat, help="only messages sent at or after this ISO date/time")
+    filters.add_argument("--before", type=datetime.fromisoformat, help="only messages sent before this ISO date/time")
+    filters.add_argument("--include-channel", action="append", default=[], metavar="ID_OR_NAME",
+                         help="only purge these guild channels (repeatable)")
+    filters.add_argument("--exclude-channel", action="append", default=[], metavar="ID_OR_NAME",
+                         help="never purge these guild channels (repeatable)")
+    filters.add_argument("--content", metavar="REGEX", help="only messages whose content matches this regex")
+    attachments = filters.add_mutually_exclusive_group()
+    attachments.add_argument("--has-attachments", dest="has_attachments", action="store_const", const=True)
+    attachments.add_argument("--no-attachments", dest="has_attachments", action="store_const", const=False)
+    pinned = filters.add_mutually_exclusive_group()
+    pinned.add_argument("--pinned", dest="pinned", action="store_const", const=True)
+    pinned.add_argument("--not-pinned", dest="pinned", action="store_const", const=False)
+
+    args = parser.parse_args(argv)
+    if not (args.guild or args.all_guilds or args.dms or args.channel):
+        parser.error("one of --guild, --all-guilds, --dms or --channel is required")
+    if args.channel and (len(args.guild) > 1 or args.all_guilds or args.dms):
+        parser.error("--channel takes at most one --guild")
+    if args.archive_attachments and not args.archive:
+        args.archive = ARCHIVE_PATH
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    reporter = JsonLinesReporter()
+
+    token = os.environ.get("DISCORD_TOKEN", "").strip()
+    if not token:
+        reporter.emit("error", message="DISCORD_TOKEN is not set")
+        return 1
+
+    client = DiscordClient(token)
+    r = client.get("/users/@me")
+    if r.status_code != 200:
+        reporter.emit("error", message=f"Failed to login: {r.status_code}")
+        return 1
+    user = r.json()
+    client.close()
+    reporter.emit("login", user_id=user['id'], username=user['username'])
+
+    engine = DeleteEngine(
+        token,
+        channel_id=args.channel,
+        guild_id=args.guild[0] if args.channel and args.guild else None,
+        user_id=user['id'],
+        guild_ids=None if args.channel else args.guild,
+        all_guilds=args.all_guilds,
+        include_dms=args.dms,
+        concurrency=args.concurrency,
+        use_search=not args.no_search,
+        resume=args.resume,
+        checkpoint_path=args.checkpoint,
+        cache_path=args.cache,
+        message_filter=MessageFilter(
+            after=args.after,
+            before=args.before,
+            content=args.content,
+            has_attachments=args.has_attachments,
+            pinned=args.pinned,
+            include_channels=args.include_channel,
+            exclude_channels=args.exclude_channel,
+        ),
+        dry_run=args.dry_run,
+        history_shards=args.history_shards,
+        include_threads=not args.no_threads,
+        metrics_path=args.metrics,
+        archive_path=args.archive,
+        archive_attachments=args.archive_attachments,
+        on_status=reporter.status,
+        on_metrics=reporter.metrics,
+    )
+    signal.signal(signal.SIGINT, lambda signum, frame: engine.stop())
+    signal.signal(signal.SIGTERM, lambda signum, frame: engine.stop())
+
+    started = time.monotonic()
+    total_deleted = engine.run()
+    if args.dry_run:
+        reporter.emit("plan", channels=engine.plan, messages=sum(engine.plan.values()),
+                      estimated_seconds=round(engine.estimated_seconds, 1))
+    guilds = {engine.guild_label(guild_id): count for guild_id, count in engine.guild_totals.items()}
+    failed_guilds = {engine.guild_label(guild_id): error for guild_id, error in engine.failed_guilds.items()}
+    reporter.emit("finished", deleted=total_deleted, guilds=guilds, failed_guilds=failed_guilds,
+                  elapsed=round(time.monotonic() - started, 3))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1717 @@
+"""Qt-free core of the Discord message deleter.
+
+Everything that talks to the Discord API lives here so the GUI in main.py
+and the headless cli.py share one engine. This module must not import PyQt5.
+"""
+import os
+import time
+import sqlite3
+import json
+import re
+import gzip
+import zlib
+import threading
+import queue
+from datetime import datetime
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import zip_longest
+import requests
+from requests.adapters import HTTPAdapter
+
+# Overridable so the GUI and CLI can be pointed at fake_discord.py
+DISCORD_API_BASE = os.environ.get("DISCORD_API_BASE", "https://discord.com/api/v9")
+DISCORD_EPOCH_MS = 1420070400000
+USER_AGENT = "DiscordBot (https://github.com/yourbot, v0.1)"
+MAX_DELETE_RETRIES = 3
+MAX_RATE_LIMIT_ATTEMPTS = 5
+NETWORK_ERROR_STATUS = 599  # stands in for a delete that never got a response; retried like a 5xx
+DEFAULT_CHANNEL_CONCURRENCY = 4
+CHECKPOINT_PATH = os.path.join(os.path.expanduser("~"), ".discord_deleter_checkpoint.db")
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".discord_deleter_cache.db")
+METRICS_PATH = os.path.join(os.path.expanduser("~"), ".discord_deleter_metrics.json")
+CACHE_MAX_MESSAGES = 500000
+CACHE_SYNC_MAX_PAGES = 50
+CHECKPOINT_BATCH_SIZE = 200
+CHECKPOINT_INTERVAL = 2.0
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (10, 30)
+DEFAULT_DELETE_RATE = 1.0
+DEFAULT_HISTORY_SHARDS = 4
+SHARD_QUEUE_SIZE = 500
+PREFETCH_QUEUE_SIZE = 500
+ARCHIVE_PATH = os.path.join(os.path.expanduser("~"), "discord_messages_archive.jsonl.gz")
+ARCHIVE_QUEUE_SIZE = 1000
+ARCHIVE_MEMBER_SIZE = 200
+ARCHIVE_DOWNLOAD_WORKERS = 4
+SHARD_MIN_SPAN = (7 * 24 * 3600 * 1000) << 22  # a week of snowflakes
+METRICS_INTERVAL = 1.0
+SUMMARY_INTERVAL = 5.0
+RATE_WINDOW = 30.0
+
+ROUTE_CHANNEL_MESSAGES = "GET /channels/{channel_id}/messages"
+ROUTE_DELETE_MESSAGE = "DELETE /channels/{channel_id}/messages/{message_id}"
+ROUTE_GUILD_CHANNELS = "GET /guilds/{guild_id}/channels"
+ROUTE_GUILD_SEARCH = "GET /guilds/{guild_id}/messages/search"
+ROUTE_CHANNEL_SEARCH = "GET /channels/{channel_id}/messages/search"
+ROUTE_MY_GUILDS = "GET /users/@me/guilds"
+ROUTE_DM_CHANNELS = "GET /users/@me/channels"
+ROUTE_ACTIVE_THREADS = "GET /guilds/{guild_id}/threads/active"
+ROUTE_PUBLIC_ARCHIVED_THREADS = "GET /channels/{channel_id}/threads/archived/public"
+ROUTE_PRIVATE_ARCHIVED_THREADS = "GET /channels/{channel_id}/users/@me/threads/archived/private"
+
+CHANNEL_TYPE_NAMES = {
+    0: "text", 1: "DM", 3: "group DM", 5: "announcement", 10: "announcement thread", 11: "public thread",
+    12: "private thread", 15: "forum", 16: "media",
+}
+MESSAGE_CHANNEL_TYPES = (0, 5)
+DM_CHANNEL_TYPES = (1, 3)
+THREAD_CHANNEL_TYPES = (10, 11, 12)
+THREAD_PARENT_TYPES = (0, 5, 15, 16)
+FORUM_CHANNEL_TYPES = (15, 16)
+
+
+# Discovery yields these between messages: every message yielded before one
+# is handled once the consumer reaches it, so the cursor is safe to save.
+Cursor = namedtuple('Cursor', 'source message_id')
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+class ApiError(Exception):
+    pass
+
+
+class RateLimiter:
+    """Schedules requests against Discord's per-route rate-limit buckets.
+
+    Buckets are learned from the X-RateLimit-* response headers and keyed by
+    the bucket hash plus the route's major parameter (channel or guild id), so
+    deletes in different channels are throttled independently. Requests that
+    still get a 429 wait out `retry_after` and are sent again.
+    """
+
+    def __init__(self, log=None):
+        self.log = log
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._route_buckets = {}
+        self._buckets = {}
+        self._global_reset_at = 0.0
+        self.rate_limited = 0
+        # Summed over every waiting thread, so it can exceed the run's wall time
+        self.sleep_time = 0.0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _bucket(self, route, major):
+        key = (self._route_buckets.get(route, route), major)
+        return self._buckets.get(key)
+
+    def acquire(self, route, major):
+        while True:
+            if self._cancelled.is_set():
+                raise RequestCancelled()
+            with self._lock:
+                now = time.monotonic()
+                wait = self._global_reset_at - now
+                bucket = self._bucket(route, major)
+                if bucket is not None:
+                    if bucket['remaining'] <= 0 and bucket['reset_at'] <= now:
+                        bucket['remaining'] = bucket['limit']
+                        bucket['reset_at'] = now + bucket['window']
+                    if bucket['remaining'] <= 0:
+                        wait = max(wait, bucket['reset_at'] - now)
+                if wait <= 0:
+                    if bucket is not None:
+                        bucket['remaining'] -= 1
+                    return
+            started = time.monotonic()
+            self._cancelled.wait(wait)
+            with self._lock:
+                self.sleep_time += time.monotonic() - started
+
+    def route_bucket(self, route):
+        """(limit, window in seconds) of a learned bucket of `route`, if any."""
+        with self._lock:
+            bucket_hash = self._route_buckets.get(route, route)
+            for (key, _), bucket in self._buckets.items():
+                if key == bucket_hash and bucket['window'] > 0:
+                    return bucket['limit'], bucket['window']
+        return None
+
+    def update(self, route, major, response):
+        headers = response.headers
+        now = time.monotonic()
+        with self._lock:
+            bucket_hash = headers.get('X-RateLimit-Bucket')
+            if bucket_hash:
+                self._route_buckets[route] = bucket_hash
+            key = (self._route_buckets.get(route, route), major)
+
+            if 'X-RateLimit-Remaining' in headers and 'X-RateLimit-Reset-After' in headers:
+                limit = int(headers.get('X-RateLimit-Limit', 1))
+                remaining = int(headers['X-RateLimit-Remaining'])
+                reset_after = float(headers['X-RateLimit-Reset-After'])
+                # Reset-After is the time left in the current window. Only the
+                # request that opened the window sees all of it; later ones
+                # can only show the window is at least that long.
+                previous = self._buckets.get(key)
+                if remaining >= limit - 1 or previous is None:
+                    window = reset_after
+                else:
+                    window = max(previous['window'], reset_after)
+                self._buckets[key] = {
+                    'limit': limit,
+                    'remaining': remaining,
+                    'reset_at': now + reset_after,
+                    'window': window,
+                }
+
+            if response.status_code != 429:
+                return
+
+            self.rate_limited += 1
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            retry_after = float(body.get('retry_after', headers.get('Retry-After', 1)))
+            if body.get('global') or headers.get('X-RateLimit-Global'):
+                self._global_reset_at = max(self._global_reset_at, now + retry_after)
+            else:
+                bucket = self._buckets.setdefault(key, {'limit': 1, 'window': retry_after})
+                bucket['remaining'] = 0
+                bucket['reset_at'] = now + retry_after
+
+        if self.log:
+            scope = "global" if body.get('global') else route
+            self.log(f"Rate limited ({scope}), retrying in {retry_after:.2f}s...")
+
+
+class DiscordClient:
+    """Discord API client with one pooled keep-alive session per thread.
+
+    Every request carries the same headers and timeout and goes through the
+    shared RateLimiter. Short-lived threads hand their session back with
+    `release`, so later threads reuse its open connections instead of opening
+    new ones. `connection_stats` reports how many requests reused an already
+    open connection.
+    """
+
+    def __init__(self, token, rate_limiter=None, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.headers = {
+            "Authorization": token,
+            "User-Agent": USER_AGENT,
+            "Content-Type": "application/json"
+        }
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.http_time = 0.0  # summed over threads, like RateLimiter.sleep_time
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions = []
+        self._idle = []
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update(self.headers)
+                with self._lock:
+                    self._sessions.append(session)
+            self._local.session = session
+        return session
+
+    def release(self):
+        """Hands the calling thread's session to the next thread that needs one."""
+        session = getattr(self._local, 'session', None)
+        if session is not None:
+            self._local.session = None
+            with self._lock:
+                self._idle.append(session)
+
+    def request(self, method, path, route=None, major=None, **kwargs):
+        route = route or f"{method} {path}"
+        kwargs.setdefault('timeout', self.timeout)
+        for _ in range(MAX_RATE_LIMIT_ATTEMPTS):
+            self.rate_limiter.acquire(route, major)
+            started = time.monotonic()
+            r = self.session.request(method, f"{DISCORD_API_BASE}{path}", **kwargs)
+            with self._lock:
+                self.http_time += time.monotonic() - started
+            self.rate_limiter.update(route, major, r)
+            if r.status_code != 429:
+                break
+        return r
+
+    def get(self, path, route=None, major=None, **kwargs):
+        return self.request("GET", path, route, major, **kwargs)
+
+    def delete(self, path, route=None, major=None, **kwargs):
+        return self.request("DELETE", path, route, major, **kwargs)
+
+    def connection_stats(self):
+        requests_sent = connections = 0
+        with self._lock:
+            adapters = {id(a): a for s in self._sessions for a in s.adapters.values()}
+            for adapter in adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is not None:
+                        requests_sent += pool.num_requests
+                        connections += pool.num_connections
+        return requests_sent, connections
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+            self._idle = []
+        self._local = threading.local()
+
+
+class MessageCache:
+    """On-disk index of channel messages, synced incrementally.
+
+    Each cached channel holds one contiguous stretch of history from
+    `oldest_id` to `newest_id`. New messages are pulled with `after=` and
+    older ones are appended as they are scanned. Only the fields the preview
+    and the deleter need are stored. When the cache holds more than
+    `max_messages`, the least recently used channels are dropped.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_messages=CACHE_MAX_MESSAGES):
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS channels (
+                channel_id TEXT PRIMARY KEY, newest_id INTEGER, oldest_id INTEGER,
+                complete INTEGER DEFAULT 0, message_count INTEGER DEFAULT 0, last_used REAL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                channel_id TEXT, id INTEGER, author_id TEXT, username TEXT, discriminator TEXT,
+                timestamp TEXT, content TEXT, pinned INTEGER, attachments TEXT,
+                PRIMARY KEY (channel_id, id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS messages_by_author ON messages (channel_id, author_id, id);
+        """)
+        self._conn.commit()
+
+    def channel(self, channel_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT newest_id, oldest_id, complete, message_count FROM channels WHERE channel_id = ?",
+                (channel_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'newest_id': str(row[0]), 'oldest_id': str(row[1]), 'complete': bool(row[2]), 'count': row[3]}
+
+    def store_page(self, channel_id, messages, older=True, complete=False):
+        # `messages` must continue the cached stretch: the page right before
+        # oldest_id when `older`, otherwise the page right after newest_id.
+        ids = [int(m['id']) for m in messages]
+        rows = [
+            (channel_id, int(m['id']), m['author']['id'], m['author'].get('username'),
+             m['author'].get('discriminator'), m.get('timestamp'), m.get('content', ''),
+             int(bool(m.get('pinned'))), json.dumps(m.get('attachments', [])))
+            for m in messages
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            added = self._conn.total_changes - before
+            self._conn.execute(
+                "INSERT OR IGNORE INTO channels (channel_id, newest_id, oldest_id, message_count) VALUES (?, ?, ?, 0)",
+                (channel_id, max(ids, default=0), min(ids, default=0))
+            )
+            if ids:
+                column, pick = ("oldest_id", "MIN") if older else ("newest_id", "MAX")
+                self._conn.execute(
+                    f"UPDATE channels SET {column} = {pick}({column}, ?) WHERE channel_id = ?",
+                    (min(ids) if older else max(ids), channel_id)
+                )
+            self._conn.execute(
+                "UPDATE channels SET message_count = message_count + ?, last_used = ?,"
+                " complete = MAX(complete, ?) WHERE channel_id = ?",
+                (added, time.time(), int(complete and older), channel_id)
+            )
+            self._enforce_limit(channel_id)
+
+    def _enforce_limit(self, keep_channel_id):
+        # The channel being written is never evicted, so one huge channel can
+        # keep the cache above the limit until it goes out of use.
+        total = self._conn.execute("SELECT COALESCE(SUM(message_count), 0) FROM channels").fetchone()[0]
+        if total <= self.max_messages:
+            return
+        for channel_id, count in self._conn.execute(
+                "SELECT channel_id, message_count FROM channels WHERE channel_id != ? ORDER BY last_used",
+                (keep_channel_id,)).fetchall():
+            self._conn.execute("DELETE FROM messages WHERE channel_id = ?", (channel_id,))
+            self._conn.execute("DELETE FROM channels WHERE channel_id = ?", (channel_id,))
+            total -= count
+            if total <= self.max_messages:
+                break
+
+    def read(self, channel_id, before_message_id=None, author_id=None, limit=100):
+        sql = ("SELECT id, author_id, username, discriminator, timestamp, content, pinned, attachments"
+               " FROM messages WHERE channel_id = ?")
+        params = [channel_id]
+        if before_message_id:
+            sql += " AND id < ?"
+            params.append(int(before_message_id))
+        if author_id:
+            sql += " AND author_id = ?"
+            params.append(author_id)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock, self._conn:
+            rows = self._conn.execute(sql, params).fetchall()
+            self._conn.execute("UPDATE channels SET last_used = ? WHERE channel_id = ?", (time.time(), channel_id))
+        return [
+            {'id': str(r[0]), 'channel_id': channel_id,
+             'author': {'id': r[1], 'username': r[2], 'discriminator': r[3]},
+             'timestamp': r[4], 'content': r[5], 'pinned': bool(r[6]), 'attachments': json.loads(r[7])}
+            for r in rows
+        ]
+
+    def evict(self, channel_id, message_ids):
+        with self._lock, self._conn:
+            removed = self._conn.executemany(
+                "DELETE FROM messages WHERE channel_id = ? AND id = ?",
+                [(channel_id, int(message_id)) for message_id in message_ids]
+            ).rowcount
+            self._conn.execute(
+                "UPDATE channels SET message_count = MAX(message_count - ?, 0) WHERE channel_id = ?",
+                (removed, channel_id)
+            )
+
+    def drop_channel(self, channel_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE channel_id = ?", (channel_id,))
+            self._conn.execute("DELETE FROM channels WHERE channel_id = ?", (channel_id,))
+
+    def sync(self, client, channel_id, cancelled=None):
+        """Pull messages newer than the cached stretch; returns how many arrived.
+
+        Uncached channels get their newest page. If the gap is too large to
+        close in CACHE_SYNC_MAX_PAGES pages, the channel is cached from scratch.
+        `cancelled()` is checked before every page; pages already stored stay.
+        """
+        cached = self.channel(channel_id)
+        if cached is not None:
+            newest_id = cached['newest_id']
+            fetched = 0
+            for _ in range(CACHE_SYNC_MAX_PAGES):
+                if cancelled and cancelled():
+                    raise RequestCancelled()
+                r = client.get(
+                    f"/channels/{channel_id}/messages", ROUTE_CHANNEL_MESSAGES, channel_id,
+                    params={"limit": 100, "after": newest_id}
+                )
+                if r.status_code != 200:
+                    raise ApiError(f"Failed to sync messages: {r.status_code}")
+                messages = r.json()
+                if messages:
+                    self.store_page(channel_id, messages, older=False)
+                    newest_id = max((m['id'] for m in messages), key=int)
+                    fetched += len(messages)
+                if len(messages) < 100:
+                    return fetched
+            self.drop_channel(channel_id)
+
+        r = client.get(f"/channels/{channel_id}/messages", ROUTE_CHANNEL_MESSAGES, channel_id, params={"limit": 100})
+        if r.status_code == 403:
+            raise ApiError(f"Failed to fetch messages for channel {channel_id}: 403 (No access)")
+        if r.status_code != 200:
+            raise ApiError(f"Failed to fetch messages: {r.status_code}")
+        messages = r.json()
+        self.store_page(channel_id, messages, older=True, complete=len(messages) < 100)
+        return len(messages)
+
+    def backfill(self, client, channel_id):
+        """Cache the page just before the oldest cached message."""
+        cached = self.channel(channel_id)
+        r = client.get(
+            f"/channels/{channel_id}/messages", ROUTE_CHANNEL_MESSAGES, channel_id,
+            params={"limit": 100, "before": cached['oldest_id']}
+        )
+        if r.status_code != 200:
+            raise ApiError(f"Failed to fetch messages: {r.status_code}")
+        messages = r.json()
+        self.store_page(channel_id, messages, older=True, complete=len(messages) < 100)
+        return messages
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Checkpoint:
+    """On-disk record of how far each channel's deletion has progressed.
+
+    Stores, per user and channel, the last history/search cursor and the ids
+    that were deleted or failed, so an interrupted run can pick up where it
+    stopped. Writes are queued and committed in batches.
+    """
+
+    def __init__(self, path, user_id):
+        self.user_id = user_id
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS channels (
+                user_id TEXT, channel_id TEXT, source TEXT, cursor TEXT, done INTEGER DEFAULT 0,
+                PRIMARY KEY (user_id, channel_id)
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                user_id TEXT, channel_id TEXT, message_id TEXT, state TEXT,
+                PRIMARY KEY (user_id, message_id)
+            );
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                route TEXT PRIMARY KEY, bucket_limit INTEGER, bucket_window REAL
+            );
+        """)
+        self._conn.commit()
+
+    def _queue(self, sql, params):
+        with self._lock:
+            self._pending.append((sql, params))
+            due = (len(self._pending) >= CHECKPOINT_BATCH_SIZE or
+                   time.monotonic() - self._last_flush >= CHECKPOINT_INTERVAL)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if not pending:
+                return
+            with self._conn:
+                for sql, params in pending:
+                    self._conn.execute(sql, params)
+
+    def load(self, channel_id):
+        self.flush()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source, cursor, done FROM channels WHERE user_id = ? AND channel_id = ?",
+                (self.user_id, channel_id)
+            ).fetchone()
+            if row is None:
+                return None
+            deleted, failed = set(), []
+            for message_id, state in self._conn.execute(
+                    "SELECT message_id, state FROM messages WHERE user_id = ? AND channel_id = ?",
+                    (self.user_id, channel_id)):
+                # 'held' messages were kept back because their archive copy is
+                # incomplete; a resume must not retry them blindly
+                if state == 'deleted':
+                    deleted.add(message_id)
+                elif state == 'failed':
+                    failed.append(message_id)
+        return {'source': row[0], 'cursor': row[1], 'done': bool(row[2]), 'deleted': deleted, 'failed': failed}
+
+    def reset(self, channel_id):
+        self._queue("DELETE FROM messages WHERE user_id = ? AND channel_id = ?", (self.user_id, channel_id))
+        self._queue(
+            "INSERT OR REPLACE INTO channels (user_id, channel_id, source, cursor, done) VALUES (?, ?, NULL, NULL, 0)",
+            (self.user_id, channel_id)
+        )
+
+    def save_cursor(self, channel_id, source, cursor):
+        self._queue(
+            "UPDATE channels SET source = ?, cursor = ? WHERE user_id = ? AND channel_id = ?",
+            (source, cursor, self.user_id, channel_id)
+        )
+
+    def mark(self, channel_id, message_id, state):
+        self._queue(
+            "INSERT OR REPLACE INTO messages (user_id, channel_id, message_id, state) VALUES (?, ?, ?, ?)",
+            (self.user_id, channel_id, message_id, state)
+        )
+
+    def finish_channel(self, channel_id):
+        self._queue("UPDATE channels SET done = 1 WHERE user_id = ? AND channel_id = ?", (self.user_id, channel_id))
+
+    def save_rate_limit(self, route, limit, window):
+        self._queue("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?)", (route, limit, window))
+
+    def rate_limit(self, route):
+        """(limit, window) last learned for `route`, or None."""
+        self.flush()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT bucket_limit, bucket_window FROM rate_limits WHERE route = ?", (route,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+class MessageArchive:
+    """Gzip-compressed JSON Lines copy of messages, written as they are found.
+
+    A writer thread appends queued messages in batches, each batch as its own
+    gzip member, so the file stays a plain .jsonl.gz and one message can be
+    read back by decompressing only its member. `<path>.index.db` maps each
+    message id to its member's byte offset and its line inside the member.
+    Attachments can be downloaded next to the archive on a bounded pool.
+
+    A message stays pending until its line (and attachments) are on disk;
+    `wait_for` lets the delete loop hold a message back until then, and
+    tells it whether any of the message's attachments failed to download.
+    """
+
+    def __init__(self, path, attachments=False, workers=ARCHIVE_DOWNLOAD_WORKERS, log=None):
+        self.path = path
+        base = path[:-len(".jsonl.gz")] if path.endswith(".jsonl.gz") else path
+        self.attachment_dir = f"{base}_attachments" if attachments else None
+        self.log = log
+        self.archived = 0
+        self.attachments_saved = 0
+        self.attachments_failed = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=ARCHIVE_QUEUE_SIZE)
+        self._cond = threading.Condition()
+        self._pending = set()
+        self._incomplete = set()
+        self._remaining = {}
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=workers) if attachments else None
+        # Bounds the downloads queued on the pool; a full pool holds up the
+        # writer, which in turn holds up discovery, never the deletes
+        self._download_slots = threading.BoundedSemaphore(workers * 4)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def add(self, message):
+        with self._cond:
+            if message['id'] in self._pending:
+                return
+            self._pending.add(message['id'])
+        while True:
+            if self.error is not None:
+                raise self.error
+            if not self._writer.is_alive():
+                raise ApiError("Message archive is closed")
+            try:
+                self._queue.put(message, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def wait_for(self, message_id):
+        """Blocks until the message is archived; False if an attachment is missing."""
+        with self._cond:
+            while message_id in self._pending and self.error is None:
+                self._cond.wait()
+            if self.error is not None:
+                raise self.error
+            return message_id not in self._incomplete
+
+    def _done(self, message_id):
+        with self._cond:
+            self._pending.discard(message_id)
+            self._cond.notify_all()
+
+    def _write_loop(self):
+        index = None
+        try:
+            index = sqlite3.connect(f"{self.path}.index.db")
+            index.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    message_id TEXT PRIMARY KEY, channel_id TEXT,
+                    member_offset INTEGER, line_offset INTEGER, length INTEGER
+                )
+            """)
+            with open(self.path, 'ab') as f:
+                while True:
+                    batch = [self._queue.get()]
+                    # Whatever else is already queued goes into the same member
+                    while len(batch) < ARCHIVE_MEMBER_SIZE and batch[-1] is not None:
+                        try:
+                            batch.append(self._queue.get_nowait())
+                        except queue.Empty:
+                            break
+                    messages = [m for m in batch if m is not None]
+                    if messages:
+                        self._write_member(f, index, messages)
+                    if batch[-1] is None:
+                        return
+        except Exception as e:
+            with self._cond:
+                self.error = e
+                self._cond.notify_all()
+        finally:
+            if index is not None:
+                index.close()
+
+    def _write_member(self, f, index, messages):
+        lines = [json.dumps(m, separators=(',', ':')).encode() + b"\n" for m in messages]
+        member_offset = f.seek(0, os.SEEK_END)
+        f.write(gzip.compress(b"".join(lines)))
+        f.flush()
+        rows = []
+        line_offset = 0
+        for message, line in zip(messages, lines):
+            rows.append((message['id'], message.get('channel_id'), member_offset, line_offset, len(line)))
+            line_offset += len(line)
+        index.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)", rows)
+        index.commit()
+        self.archived += len(messages)
+
+        for message in messages:
+            attachments = (message.get('attachments') or []) if self._pool else []
+            if not attachments:
+                self._done(message['id'])
+                continue
+            with self._cond:
+                self._remaining[message['id']] = len(attachments)
+            for attachment in attachments:
+                self._download_slots.acquire()
+                self._pool.submit(self._download, message, attachment)
+
+    def _download(self, message, attachment):
+        try:
+            session = getattr(self._local, 'session', None)
+            if session is None:
+                session = self._local.session = requests.Session()
+            folder = os.path.join(self.attachment_dir, message.get('channel_id') or "unknown")
+            os.makedirs(folder, exist_ok=True)
+            filename = re.sub(r'[^\w.-]', '_', attachment.get('filename') or 'file')
+            target = os.path.join(folder, f"{message['id']}_{attachment['id']}_{filename}")
+            with session.get(attachment['url'], stream=True, timeout=DEFAULT_TIMEOUT) as r:
+                r.raise_for_status()
+                with open(target, 'wb') as out:
+                    for chunk in r.iter_content(chunk_size=65536):
+                        out.write(chunk)
+            with self._cond:
+                self.attachments_saved += 1
+        except Exception as e:
+            with self._cond:
+                self.attachments_failed += 1
+                self._incomplete.add(message['id'])
+            if self.log:
+                self.log(f"Failed to archive attachment {attachment.get('filename')} of {message['id']}: {str(e)}")
+        finally:
+            self._download_slots.release()
+            with self._cond:
+                self._remaining[message['id']] -= 1
+                finished = self._remaining[message['id']] == 0
+                if finished:
+                    del self._remaining[message['id']]
+            if finished:
+                self._done(message['id'])
+
+    def close(self):
+        while self._writer.is_alive():
+            try:
+                self._queue.put(None, timeout=0.5)
+                break
+            except queue.Full:
+                continue
+        self._writer.join()
+        if self._pool:
+            self._pool.shutdown(wait=True)
+
+
+def read_archived_message(path, message_id):
+    """Reads one message back from a MessageArchive file, or None."""
+    index = sqlite3.connect(f"{path}.index.db")
+    try:
+        row = index.execute(
+            "SELECT member_offset, line_offset, length FROM messages WHERE message_id = ?", (str(message_id),)
+        ).fetchone()
+    finally:
+        index.close()
+    if row is None:
+        return None
+    member_offset, line_offset, length = row
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)  # one gzip member
+    data = b""
+    with open(path, 'rb') as f:
+        f.seek(member_offset)
+        while len(data) < line_offset + length and not decompressor.eof:
+            chunk = f.read(65536)
+            if not chunk:
+                break
+            data += decompressor.decompress(chunk)
+    return json.loads(data[line_offset:line_offset + length])
+
+
+def snowflake_time(snowflake):
+    return datetime.fromtimestamp(((int(snowflake) >> 22) + DISCORD_EPOCH_MS) / 1000)
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s"
+
+
+def format_metrics(metrics, dry_run=False):
+    requests_summary = (
+        f"{metrics['history_pages'] + metrics['search_pages']} pages, "
+        f"{metrics['rate_limited']} x 429, {metrics['sleep_time']:.1f} thread-s waiting on rate limits "
+        f"vs {metrics['http_time']:.1f} thread-s in HTTP"
+    )
+    if dry_run:
+        # Nothing is deleted, so there is no rate or ETA to show
+        return f"Dry run: {metrics['candidates']} message(s) would be deleted - {requests_summary}"
+    eta = format_duration(metrics['eta']) if metrics['eta'] is not None else "unknown"
+    return (
+        f"{metrics['deleted']}/{metrics['candidates']} deleted, {metrics['failed']} failed, "
+        f"{metrics['rate']:.1f} msg/s, ETA {eta} - {requests_summary}"
+    )
+
+
+def snowflake_from_time(moment):
+    return (int(moment.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22
+
+
+def channel_kind(channel, parents):
+    parent = parents.get(channel.get('parent_id'))
+    if channel['type'] == 11 and parent and parent['type'] in FORUM_CHANNEL_TYPES:
+        return "forum post"
+    return CHANNEL_TYPE_NAMES.get(channel['type'], f"type {channel['type']}")
+
+
+def channel_label(channel, parents):
+    parent = parents.get(channel.get('parent_id'))
+    if channel['type'] in THREAD_CHANNEL_TYPES and parent:
+        return f"{parent['name']} / {channel['name']}"
+    return channel['name']
+
+
+def list_archived_threads(client, channel_id, private=False, cancelled=None):
+    # Public listings page by archive time; the joined private listing pages by thread id
+    if private:
+        path, route = f"/channels/{channel_id}/users/@me/threads/archived/private", ROUTE_PRIVATE_ARCHIVED_THREADS
+    else:
+        path, route = f"/channels/{channel_id}/threads/archived/public", ROUTE_PUBLIC_ARCHIVED_THREADS
+    threads = []
+    params = {"limit": 100}
+    while True:
+        if cancelled and cancelled():
+            raise RequestCancelled()
+        r = client.get(path, route, channel_id, params=params)
+        if r.status_code == 403:
+            # No access to the parent channel, or to its private threads
+            return threads
+        if r.status_code != 200:
+            raise ApiError(f"Failed to list archived threads in {channel_id}: {r.status_code}")
+        data = r.json()
+        page = data.get('threads', [])
+        threads.extend(page)
+        if not data.get('has_more') or not page:
+            return threads
+        last = page[-1]
+        params["before"] = last['id'] if private else last['thread_metadata']['archive_timestamp']
+
+
+def discover_channels(client, guild_id, include_threads=True, concurrency=DEFAULT_CHANNEL_CONCURRENCY,
+                      cancelled=None):
+    """Lists every channel in a guild that can hold the user's messages.
+
+    Returns `(channels, parents)`: the text, announcement and thread channels
+    to purge, and the guild's channels by id so threads can be traced back to
+    the channel or forum they were started in.
+    """
+    channels, parents = list_guild_channels(client, guild_id)
+    if include_threads:
+        channels += discover_threads(client, guild_id, parents, concurrency, cancelled)
+    return channels, parents
+
+
+def list_guild_channels(client, guild_id):
+    """The guild's text and announcement channels, and all its channels by id."""
+    r = client.get(f"/guilds/{guild_id}/channels", ROUTE_GUILD_CHANNELS, guild_id)
+    if r.status_code != 200:
+        raise ApiError(f"Failed to fetch guild channels: {r.status_code}")
+    parents = {ch['id']: ch for ch in r.json()}
+    return [ch for ch in parents.values() if ch['type'] in MESSAGE_CHANNEL_TYPES], parents
+
+
+def discover_threads(client, guild_id, parents, concurrency=DEFAULT_CHANNEL_CONCURRENCY, cancelled=None):
+    """Active and archived threads and forum posts of the guild.
+
+    Archived threads are listed per parent channel, with the listings paged
+    in parallel. `cancelled()` is checked before every listing page.
+    """
+    threads = []
+    r_active = client.get(f"/guilds/{guild_id}/threads/active", ROUTE_ACTIVE_THREADS, guild_id)
+    if r_active.status_code == 200:
+        threads.extend(r_active.json().get('threads', []))
+    elif r_active.status_code != 403:
+        raise ApiError(f"Failed to fetch active threads: {r_active.status_code}")
+
+    # Private threads only exist in text channels
+    listings = [(ch['id'], False) for ch in parents.values() if ch['type'] in THREAD_PARENT_TYPES]
+    listings += [(ch['id'], True) for ch in parents.values() if ch['type'] == 0]
+    def list_threads(listing):
+        try:
+            return list_archived_threads(client, *listing, cancelled=cancelled)
+        finally:
+            client.release()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for page in pool.map(list_threads, listings):
+            threads.extend(page)
+
+    found = {}
+    for thread in threads:
+        if thread['type'] in THREAD_CHANNEL_TYPES:
+            found.setdefault(thread['id'], thread)
+    return list(found.values())
+
+
+def discover_dm_channels(client):
+    r = client.get("/users/@me/channels", ROUTE_DM_CHANNELS)
+    if r.status_code != 200:
+        raise ApiError(f"Failed to fetch DM channels: {r.status_code}")
+    channels = []
+    for ch in r.json():
+        if ch['type'] not in DM_CHANNEL_TYPES:
+            continue
+        recipients = ", ".join(u.get('global_name') or u['username'] for u in ch.get('recipients', []))
+        channels.append(dict(ch, name=ch.get('name') or f"DM with {recipients or ch['id']}"))
+    return channels
+
+
+def interleave(groups):
+    # Round robin over the groups so neighbouring jobs belong to different
+    # guilds and their per-guild buckets are drained side by side
+    return [ch for batch in zip_longest(*groups) for ch in batch if ch is not None]
+
+
+class MessageFilter:
+    """Composable checks deciding which of the user's messages get deleted.
+
+    The `after`/`before` datetimes become snowflake bounds (`min_id` and
+    `max_id`) so discovery can start and stop its cursors at the edges of the
+    window instead of paging through the whole channel.
+    """
+
+    def __init__(self, after=None, before=None, content=None, has_attachments=None, pinned=None,
+                 include_channels=None, exclude_channels=None):
+        self.min_id = snowflake_from_time(after) if after else None
+        self.max_id = snowflake_from_time(before) if before else None
+        self.include_channels = set(include_channels or ())
+        self.exclude_channels = set(exclude_channels or ())
+        self.checks = []
+        if self.min_id is not None:
+            self.checks.append(lambda msg: int(msg['id']) >= self.min_id)
+        if self.max_id is not None:
+            self.checks.append(lambda msg: int(msg['id']) < self.max_id)
+        if content:
+            pattern = re.compile(content)
+            self.checks.append(lambda msg: pattern.search(msg.get('content') or '') is not None)
+        if has_attachments is not None:
+            self.checks.append(lambda msg: bool(msg.get('attachments')) == has_attachments)
+        if pinned is not None:
+            self.checks.append(lambda msg: bool(msg.get('pinned')) == pinned)
+
+    def matches(self, msg):
+        return all(check(msg) for check in self.checks)
+
+    def allows_channel(self, channel, parent=None):
+        # Threads follow the rules of the channel they were started in
+        keys = {channel['id'], channel.get('name')}
+        if parent:
+            keys |= {parent['id'], parent.get('name')}
+        if self.include_channels and not keys & self.include_channels:
+            return False
+        return not keys & self.exclude_channels
+
+    def before_window(self, message_id):
+        return self.min_id is not None and int(message_id) < self.min_id
+
+    def start_cursor(self, cursor=None):
+        # The tighter of a resume cursor and the window's upper bound
+        if self.max_id is None:
+            return cursor
+        if cursor is None or int(cursor) > self.max_id:
+            return str(self.max_id)
+        return cursor
+
+
+class DeleteEngine:
+    """Finds and deletes the user's messages in a channel or a whole guild.
+
+    Holds no Qt state; status lines are reported through `on_status(message)`
+    and progress through `on_metrics(metrics)`, which gets a snapshot of the
+    run's counters every second, so the same engine drives the GUI worker and
+    the command-line tool. The log gets a summary line every few seconds.
+    """
+
+    def __init__(self, token, channel_id=None, guild_id=None, user_id=None, delete_all_channels=False,
+                 guild_ids=None, all_guilds=False, include_dms=False,
+                 concurrency=DEFAULT_CHANNEL_CONCURRENCY, use_search=True,
+                 resume=False, checkpoint_path=CHECKPOINT_PATH, cache_path=CACHE_PATH,
+                 message_filter=None, dry_run=False, history_shards=DEFAULT_HISTORY_SHARDS,
+                 include_threads=True, metrics_path=None, archive_path=None, archive_attachments=False,
+                 on_status=None, on_metrics=None):
+        self.token = token
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.delete_all_channels = delete_all_channels
+        self.guild_ids = list(guild_ids or ([guild_id] if delete_all_channels and guild_id else []))
+        self.all_guilds = all_guilds
+        self.include_dms = include_dms
+        self.guild_names = {}
+        self.guild_totals = {}
+        self.failed_guilds = {}
+        self.concurrency = max(1, concurrency)
+        self.use_search = use_search
+        self.resume = resume
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = None
+        self.cache_path = cache_path
+        self.cache = None
+        self.message_filter = message_filter or MessageFilter()
+        self.dry_run = dry_run
+        self.history_shards = max(1, history_shards)
+        self.include_threads = include_threads
+        self.metrics_path = metrics_path
+        self.archive_path = archive_path
+        self.archive_attachments = archive_attachments
+        self.archive = None
+        self.plan = {}
+        self.estimated_seconds = 0.0
+        self._is_running = True
+        self._counter_lock = threading.Lock()
+        self.total_deleted = 0
+        self.pages_fetched = 0
+        self.search_pages = 0
+        self.candidates = 0
+        self.failed = 0
+        self.channels_done = 0
+        self.channels_total = 0
+        self.started = self.purge_started = None
+        self._samples = deque()
+        self._active_scans = []
+        self.last_metrics = None
+        self.on_status = on_status or (lambda message: None)
+        self.on_metrics = on_metrics or (lambda metrics: None)
+        self.rate_limiter = RateLimiter(log=self.on_status)
+        self.client = DiscordClient(self.token, self.rate_limiter)
+
+    def run(self):
+        self.total_deleted = 0
+        self.pages_fetched = 0
+        self.search_pages = 0
+        self.candidates = 0
+        self.failed = 0
+        self.channels_done = self.channels_total = 0
+        self.started = time.monotonic()
+        self.purge_started = None
+        self._samples.clear()
+        self._samples.append((self.started, 0))
+        self._active_scans = []
+        self.plan = {}
+        monitor_stop = threading.Event()
+        monitor = threading.Thread(target=self._monitor, args=(monitor_stop,), daemon=True)
+        monitor.start()
+        try:
+            # A dry run must not disturb the checkpoint of a real job
+            self.checkpoint = Checkpoint(":memory:" if self.dry_run else self.checkpoint_path, self.user_id)
+            self.cache = MessageCache(self.cache_path)
+            if self.archive_path:
+                self.archive = MessageArchive(self.archive_path, self.archive_attachments, log=self.on_status)
+            if self.guild_ids or self.all_guilds or self.include_dms:
+                channels = self.schedule_channels()
+                self.purge_channels(channels)
+                channel_count = len(channels)
+                self.report_guild_totals()
+            else:
+                if not self.channel_id:
+                    self.on_status("No channel selected")
+                    return self.total_deleted
+
+                self.channels_total = 1
+                self.purge_started = time.monotonic()
+                self.purge_channel(self.channel_id, None, self.guild_id)
+                self.channels_done = 1
+                channel_count = 1
+
+            self.on_status(
+                f"Fetched {self.pages_fetched} history and {self.search_pages} search pages "
+                f"across {channel_count} channel(s)"
+            )
+            if self.dry_run:
+                self.report_plan()
+            self.on_status(
+                f"Rate limits: {self.rate_limiter.rate_limited} x 429, "
+                f"{self.rate_limiter.sleep_time:.1f} thread-seconds spent waiting on buckets, "
+                f"{self.client.http_time:.1f} thread-seconds in HTTP requests (summed over all threads)"
+            )
+            requests_sent, connections = self.client.connection_stats()
+            self.on_status(
+                f"Connections: {requests_sent} requests over {connections} connection(s), "
+                f"{requests_sent - connections} reused"
+            )
+
+        except RequestCancelled:
+            self.on_status("Deletion cancelled")
+        except ApiError as e:
+            self.on_status(str(e))
+        except Exception as e:
+            self.on_status(f"Exception: {str(e)}")
+        finally:
+            if self.archive:
+                self.close_archive()
+            monitor_stop.set()
+            monitor.join()
+            self.last_metrics = self.metrics()
+            self.on_metrics(self.last_metrics)
+            self.on_status(format_metrics(self.last_metrics, self.dry_run))
+            if self.metrics_path:
+                self.export_metrics(self.last_metrics)
+            if self.checkpoint:
+                # Kept for dry runs, which send no deletes to learn the bucket from
+                delete_bucket = self.rate_limiter.route_bucket(ROUTE_DELETE_MESSAGE)
+                if delete_bucket and not self.dry_run:
+                    self.checkpoint.save_rate_limit(ROUTE_DELETE_MESSAGE, *delete_bucket)
+                self.checkpoint.close()
+            if self.cache:
+                self.cache.close()
+            self.client.close()
+
+        return self.total_deleted
+
+    def metrics(self):
+        # The deletion rate is measured over the last RATE_WINDOW seconds, so
+        # the ETA follows bucket changes instead of the whole run's average
+        now = time.monotonic()
+        with self._counter_lock:
+            metrics = {
+                'elapsed': round(now - self.started, 3),
+                'channels_done': self.channels_done,
+                'channels_total': self.channels_total,
+                # Pages of channels still being scanned count as they come in
+                'history_pages': self.pages_fetched + sum(scan['history'] for scan in self._active_scans),
+                'search_pages': self.search_pages + sum(scan['search'] for scan in self._active_scans),
+                'candidates': self.candidates,
+                'deleted': self.total_deleted,
+                'failed': self.failed,
+            }
+        self._samples.append((now, metrics['deleted']))
+        while now - self._samples[0][0] > RATE_WINDOW:
+            self._samples.popleft()
+        span = now - self._samples[0][0]
+        rate = (metrics['deleted'] - self._samples[0][1]) / span if span > 0 else 0.0
+
+        # Candidates are only known once a channel has been scanned, so the
+        # channel pace also bounds the ETA from below
+        eta = None
+        remaining = metrics['candidates'] - metrics['deleted'] - metrics['failed']
+        if rate > 0:
+            eta = remaining / rate
+        if self.purge_started is not None and 0 < self.channels_done < self.channels_total:
+            per_channel = (now - self.purge_started) / self.channels_done
+            eta = max(eta or 0.0, per_channel * (self.channels_total - self.channels_done))
+        elif remaining <= 0 and 0 < self.channels_total == self.channels_done:
+            eta = 0.0
+
+        metrics.update(
+            rate_limited=self.rate_limiter.rate_limited,
+            sleep_time=round(self.rate_limiter.sleep_time, 3),
+            http_time=round(self.client.http_time, 3),
+            rate=round(rate, 2),
+            eta=round(eta, 1) if eta is not None else None,
+        )
+        return metrics
+
+    def _monitor(self, stop):
+        # Metrics every second; the log gets one coalesced line every few
+        # seconds instead of a line per deleted message
+        last_summary = time.monotonic()
+        while not stop.wait(METRICS_INTERVAL):
+            metrics = self.metrics()
+            self.on_metrics(metrics)
+            if time.monotonic() - last_summary >= SUMMARY_INTERVAL:
+                last_summary = time.monotonic()
+                self.on_status(format_metrics(metrics, self.dry_run))
+
+    def close_archive(self):
+        self.archive.close()
+        saved = f" and {self.archive.attachments_saved} attachment(s)" if self.archive.attachment_dir else ""
+        failed = f", {self.archive.attachments_failed} attachment(s) failed" if self.archive.attachments_failed else ""
+        self.on_status(f"Archived {self.archive.archived} message(s){saved} to {self.archive.path}{failed}")
+        if self.archive.error is not None:
+            self.on_status(f"Archive stopped early: {str(self.archive.error)}")
+        self.archive = None
+
+    def export_metrics(self, metrics):
+        report = dict(
+            metrics,
+            dry_run=self.dry_run,
+            guilds={self.guild_label(guild_id): count for guild_id, count in self.guild_totals.items()},
+            failed_guilds={self.guild_label(guild_id): error for guild_id, error in self.failed_guilds.items()},
+        )
+        try:
+            with open(self.metrics_path, 'w') as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            self.on_status(f"Failed to write metrics: {str(e)}")
+            return
+        self.on_status(f"Metrics written to {self.metrics_path}")
+
+    def report_plan(self):
+        counts = [count for count in self.plan.values() if count]
+        bucket = self.rate_limiter.route_bucket(ROUTE_DELETE_MESSAGE) or self.saved_rate_limit(ROUTE_DELETE_MESSAGE)
+        rate = bucket[0] / bucket[1] if bucket else DEFAULT_DELETE_RATE
+        source = "learned delete limit" if bucket else "default rate, no delete limit learned yet"
+        parallel = min(self.concurrency, len(counts)) or 1
+        # Channels are deleted in parallel, but never faster than the largest
+        # channel's own bucket allows
+        self.estimated_seconds = max(sum(counts) / (rate * parallel), max(counts, default=0) / rate)
+        self.on_status(
+            f"Dry run: {sum(counts)} message(s) would be deleted in {len(counts)} channel(s), "
+            f"estimated {format_duration(self.estimated_seconds)} at {rate:.2f} deletes/s per channel ({source})"
+        )
+
+    def saved_rate_limit(self, route):
+        # A dry run's own checkpoint is in memory; the limits learned by real
+        # runs are only read from the one on disk
+        try:
+            checkpoint = Checkpoint(self.checkpoint_path, self.user_id)
+        except sqlite3.Error:
+            return None
+        try:
+            return checkpoint.rate_limit(route)
+        finally:
+            checkpoint.close()
+
+    def schedule_channels(self):
+        # One queue for every target: each guild's channels, then the DMs,
+        # interleaved so the pool works on several guilds at the same time
+        r = self.client.get("/users/@me/guilds", ROUTE_MY_GUILDS)
+        if r.status_code == 200:
+            self.guild_names = {g['id']: g['name'] for g in r.json()}
+        elif self.all_guilds:
+            raise ApiError(f"Failed to fetch guilds: {r.status_code}")
+        guild_ids = list(self.guild_names) if self.all_guilds else self.guild_ids
+
+        groups = []
+        for guild_id in guild_ids:
+            if not self._is_running:
+                break
+            self.guild_totals[guild_id] = 0
+            try:
+                groups.append(self.select_channels(guild_id))
+            except (ApiError, requests.RequestException) as e:
+                # One guild that cannot be listed must not cost the others their run
+                self.skip_guild(guild_id, e)
+        if self.include_dms and self._is_running:
+            self.guild_totals[None] = 0
+            try:
+                channels = [ch for ch in discover_dm_channels(self.client) if self.message_filter.allows_channel(ch)]
+            except (ApiError, requests.RequestException) as e:
+                self.skip_guild(None, e)
+            else:
+                self.on_status(f"Found {len(channels)} DM channel(s) to purge")
+                groups.append(channels)
+        return interleave(groups)
+
+    def skip_guild(self, guild_id, error):
+        self.failed_guilds[guild_id] = str(error)
+        self.on_status(f"Skipping {self.guild_label(guild_id)}: {str(error)}")
+
+    def guild_label(self, guild_id):
+        if guild_id is None:
+            return "Direct messages"
+        return self.guild_names.get(guild_id, guild_id)
+
+    def report_guild_totals(self):
+        if len(self.guild_totals) < 2 and not self.failed_guilds:
+            return
+        verb = "would delete" if self.dry_run else "deleted"
+        for guild_id, deleted in sorted(self.guild_totals.items(), key=lambda item: -item[1]):
+            if guild_id in self.failed_guilds:
+                self.on_status(f"{self.guild_label(guild_id)}: failed ({self.failed_guilds[guild_id]})")
+            else:
+                self.on_status(f"{self.guild_label(guild_id)}: {deleted} {verb}")
+
+    def select_channels(self, guild_id):
+        label = self.guild_label(guild_id)
+        self.on_status(f"Discovering channels{' and threads' if self.include_threads else ''} in {label}")
+        channels, parents = discover_channels(self.client, guild_id, self.include_threads, self.concurrency)
+        selected = [
+            ch for ch in channels
+            if self.message_filter.allows_channel(ch, parents.get(ch.get('parent_id')))
+        ]
+        counts = {}
+        for ch in selected:
+            kind = channel_kind(ch, parents)
+            counts[kind] = counts.get(kind, 0) + 1
+        summary = ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items(), key=lambda item: -item[1]))
+        self.on_status(f"Found {len(selected)} channel(s) to purge in {label}: {summary or 'none'}")
+        return [dict(ch, name=channel_label(ch, parents), guild_id=guild_id) for ch in selected]
+
+    def purge_channels(self, channels):
+        # Deletes are rate limited per channel, so several channels can be worked
+        # on at once; the shared RateLimiter keeps the global budget honest.
+        self.on_status(f"Deleting messages in {len(channels)} channel(s), {self.concurrency} at a time")
+        with self._counter_lock:
+            self.channels_total = len(channels)
+        self.purge_started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {
+                pool.submit(self.purge_channel, ch['id'], ch['name'], ch.get('guild_id')): ch
+                for ch in channels
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                channel = futures[future]
+                with self._counter_lock:
+                    self.channels_done = done
+                try:
+                    deleted = future.result()
+                except RequestCancelled:
+                    continue
+                except Exception as e:
+                    self.on_status(f"Exception in {channel['name']}: {str(e)}")
+                    continue
+                guild_id = channel.get('guild_id')
+                self.guild_totals[guild_id] = self.guild_totals.get(guild_id, 0) + deleted
+                if self.dry_run:
+                    self.on_status(f"Planned {channel['name']}: {deleted} to delete ({done}/{len(channels)} channels)")
+                else:
+                    self.on_status(
+                        f"Finished {channel['name']}: {deleted} deleted "
+                        f"({done}/{len(channels)} channels, {self.total_deleted} total)"
+                    )
+
+    def count(self, candidates=0, failed=0):
+        with self._counter_lock:
+            self.candidates += candidates
+            self.failed += failed
+
+    def record_deleted(self):
+        with self._counter_lock:
+            self.total_deleted += 1
+
+    def purge_channel(self, channel_id, channel_name, guild_id=None):
+        label = f" in {channel_name}" if channel_name else ""
+        if not self._is_running:
+            return 0
+
+        state = self.checkpoint.load(channel_id) if self.resume else None
+        if state is None:
+            self.checkpoint.reset(channel_id)
+        elif state['done']:
+            self.on_status(f"Skipping {channel_name or channel_id}: finished in a previous run")
+            return 0
+        else:
+            self.on_status(f"Resuming{label} from {state['source'] or 'the newest message'}")
+
+        if channel_name:
+            self.on_status(f"Deleting messages in channel: {channel_name}")
+        deleted = 0
+        retry_ids = list(state['failed']) if state else []
+        already_deleted = state['deleted'] if state else set()
+        self.count(candidates=len(retry_ids))
+        scan = {'history': 0, 'search': 0, 'complete': False}
+        with self._counter_lock:
+            self._active_scans.append(scan)
+
+        # Discovery runs ahead on its own thread, so history and search pages
+        # are fetched while this thread works through the delete bucket
+        discovered = self.iter_my_messages(channel_id, channel_name, scan, state, guild_id)
+        if self.archive:
+            discovered = self.archive_candidates(discovered, already_deleted)
+        messages = self.prefetch(discovered)
+        for msg in messages:
+            if not self._is_running:
+                break
+            if isinstance(msg, Cursor):
+                self.checkpoint.save_cursor(channel_id, msg.source, msg.message_id)
+                continue
+            if msg['id'] in already_deleted or not self.message_filter.matches(msg):
+                continue
+            self.count(candidates=1)
+            if self.dry_run:
+                deleted += 1
+                continue
+            # Normally written long ago by the time the deleter gets here
+            if self.archive and not self.archive.wait_for(msg['id']):
+                # Kept, so deleting it never loses an attachment that was not saved
+                self.on_status(f"Kept {msg['id']}{label}: its attachments could not be archived")
+                self.checkpoint.mark(channel_id, msg['id'], 'held')
+                self.count(failed=1)
+                continue
+            code = self.delete_message(channel_id, msg['id'], label)
+            if code == 204:
+                deleted += 1
+                self.record_deleted()
+                self.checkpoint.mark(channel_id, msg['id'], 'deleted')
+                self.cache.evict(channel_id, [msg['id']])
+            elif code == 429 or code >= 500:
+                retry_ids.append(msg['id'])
+                self.checkpoint.mark(channel_id, msg['id'], 'failed')
+            elif code != 404:
+                self.count(failed=1)
+        messages.close()
+
+        for attempt in range(1, MAX_DELETE_RETRIES + 1):
+            if not retry_ids or not self._is_running:
+                break
+            self.on_status(f"Retrying {len(retry_ids)} failed deletion(s){label} (attempt {attempt}/{MAX_DELETE_RETRIES})")
+            still_failed = []
+            for message_id in retry_ids:
+                if not self._is_running:
+                    break
+                code = self.delete_message(channel_id, message_id, label)
+                if code == 204:
+                    deleted += 1
+                    self.record_deleted()
+                    self.checkpoint.mark(channel_id, message_id, 'deleted')
+                    self.cache.evict(channel_id, [message_id])
+                elif code == 429 or code >= 500:
+                    still_failed.append(message_id)
+                elif code != 404:
+                    self.count(failed=1)
+            retry_ids = still_failed
+
+        if retry_ids:
+            self.count(failed=len(retry_ids))
+            self.on_status(f"Gave up on {len(retry_ids)} message(s){label}: {', '.join(retry_ids)}")
+        elif scan['complete'] and self._is_running:
+            self.checkpoint.finish_channel(channel_id)
+
+        with self._counter_lock:
+            self._active_scans.remove(scan)
+            self.pages_fetched += scan['history']
+            self.search_pages += scan['search']
+            if self.dry_run:
+                self.plan[channel_id] = deleted
+        self.on_status(f"Scanned {scan['history']} history and {scan['search']} search page(s){label}")
+        return deleted
+
+    def iter_my_messages(self, channel_id, channel_name, scan, state=None, guild_id=None):
+        # A fully cached channel only needs the messages posted since the last
+        # sync. Otherwise prefer the search index, which only returns our
+        # own messages. If search is unavailable, not indexed yet, or fails
+        # part-way, fall back to scanning history from the oldest message
+        # search already handled, or from where the cached stretch ends.
+        # Cursors start at the filter's upper time bound when it has one.
+        # The cache keeps only the fields the preview and deleter need, so an
+        # archiving run reads every message from the API to archive it whole.
+        source = state['source'] if state else None
+        cursor = state['cursor'] if state else None
+        cached = self.cache.channel(channel_id) if cursor is None else None
+        use_cache = cached is not None and not self.archive
+        if use_cache and cached['complete']:
+            # A gap too large to sync re-caches the channel from its newest
+            # page, so check again before trusting the cache with the channel
+            self.cache.sync(self.client, channel_id)
+            cached = self.cache.channel(channel_id)
+            if cached and cached['complete']:
+                yield from self.iter_cached(channel_id, sync=False)
+                scan['complete'] = True
+                return
+        cursor = self.message_filter.start_cursor(cursor)
+        if self.use_search and source in (None, 'search'):
+            done, cursor = yield from self.search_my_messages(channel_id, channel_name, scan, cursor, guild_id)
+            if done:
+                return
+        # History pages may only extend a cached stretch from its oldest end
+        cache_pages = cursor is None and (cached is None or use_cache)
+        if cursor is None and use_cache:
+            yield from self.iter_cached(channel_id)
+            cursor = self.cache.channel(channel_id)['oldest_id']
+        if cursor is not None and self.message_filter.before_window(cursor):
+            scan['complete'] = True
+            return
+        yield from self.scan_history_sharded(channel_id, channel_name, scan, cursor, cache_pages)
+
+    def iter_cached(self, channel_id, sync=True):
+        if sync:
+            self.cache.sync(self.client, channel_id)
+        before_message_id = self.message_filter.start_cursor()
+        while self._is_running:
+            rows = self.cache.read(channel_id, before_message_id, self.user_id)
+            if not rows:
+                break
+            before_message_id = rows[-1]['id']
+            yield from rows
+            if self.message_filter.before_window(before_message_id):
+                break
+
+    def search_my_messages(self, channel_id, channel_name, scan, max_id=None, guild_id=None):
+        # Guild channels are searched through their guild's index, DMs through
+        # their own
+        label = f" in {channel_name}" if channel_name else ""
+        if guild_id:
+            path, route, major = f"/guilds/{guild_id}/messages/search", ROUTE_GUILD_SEARCH, guild_id
+        else:
+            path, route, major = f"/channels/{channel_id}/messages/search", ROUTE_CHANNEL_SEARCH, channel_id
+
+        while self._is_running:
+            params = {
+                "author_id": self.user_id,
+                "channel_id": channel_id,
+                "sort_by": "timestamp",
+                "sort_order": "desc",
+                "include_nsfw": "true",
+            }
+            if max_id:
+                # Everything newer than max_id has been handled by now
+                params["max_id"] = max_id
+                yield Cursor('search', max_id)
+            if self.message_filter.min_id is not None:
+                params["min_id"] = str(self.message_filter.min_id)
+
+            r = self.client.get(path, route, major, params=params)
+            if r.status_code == 202:
+                self.on_status(f"Search index not ready{label}, scanning history instead")
+                return False, max_id
+            if r.status_code != 200:
+                self.on_status(f"Search unavailable{label} ({r.status_code}), scanning history instead")
+                return False, max_id
+
+            scan['search'] += 1
+            hits = []
+            for group in r.json().get('messages', []):
+                # Older API versions return the hit surrounded by context messages
+                msg = next((m for m in group if m.get('hit')), group[0] if group else None)
+                if msg and msg['author']['id'] == self.user_id:
+                    if max_id is None or int(msg['id']) < int(max_id):
+                        hits.append(msg)
+            if not hits:
+                scan['complete'] = True
+                return True, None
+
+            for msg in hits:
+                yield msg
+            max_id = min((m['id'] for m in hits), key=int)
+            if self.message_filter.before_window(max_id):
+                scan['complete'] = True
+                return True, None
+
+        return True, None
+
+    def scan_history(self, channel_id, channel_name, scan, before_message_id=None, cache_pages=False):
+        # Walk the history once, oldest-seen id as the cursor. Deleting our own
+        # messages never shifts a `before` cursor, so there is no need to rescan
+        # from the newest message. Pages that extend the cached stretch are
+        # written to the cache on the way.
+        label = f" in {channel_name}" if channel_name else ""
+
+        while self._is_running:
+            params = {"limit": 100}
+            if before_message_id:
+                params["before"] = before_message_id
+                yield Cursor('history', before_message_id)
+
+            r = self.client.get(
+                f"/channels/{channel_id}/messages", ROUTE_CHANNEL_MESSAGES, channel_id, params=params
+            )
+            if r.status_code == 403:
+                self.on_status(f"Skipping channel {channel_name or channel_id}: No access (403)")
+                scan['complete'] = True
+                break
+            if r.status_code != 200:
+                self.on_status(f"Failed to fetch messages{label}: {r.status_code}")
+                break
+
+            scan['history'] += 1
+            messages = r.json()
+            if cache_pages:
+                self.cache.store_page(channel_id, messages, older=True, complete=len(messages) < 100)
+            if not messages:
+                scan['complete'] = True
+                break
+            before_message_id = messages[-1]['id']
+
+            for msg in messages:
+                if msg['author']['id'] == self.user_id:
+                    yield msg
+
+            if len(messages) < 100 or self.message_filter.before_window(before_message_id):
+                scan['complete'] = True
+                break
+
+    def scan_history_sharded(self, channel_id, channel_name, scan, before_message_id=None, cache_pages=False):
+        # Split the span between the oldest message and the cursor into
+        # snowflake ranges and page through them with parallel cursors. Shards
+        # queue only our own messages, so a range full of other people's
+        # messages keeps scanning while the deleter works on newer ranges.
+        # Draining the shards in order keeps the merged stream newest to oldest.
+        label = f" in {channel_name}" if channel_name else ""
+        lower = None
+        if self.history_shards > 1:
+            lower = self.oldest_message_id(channel_id, scan)
+        upper = int(before_message_id) if before_message_id else snowflake_from_time(datetime.now())
+        if lower is None or upper - lower < SHARD_MIN_SPAN:
+            yield from self.scan_history(channel_id, channel_name, scan, before_message_id, cache_pages)
+            return
+
+        step = (upper - lower) // self.history_shards
+        bounds = [upper - step * i for i in range(self.history_shards)] + [self.message_filter.min_id]
+        stopped = threading.Event()
+        queues = []
+        for index in range(self.history_shards):
+            out = queue.Queue(maxsize=SHARD_QUEUE_SIZE)
+            start = before_message_id if index == 0 else str(bounds[index])
+            threading.Thread(
+                target=self._scan_shard, daemon=True,
+                args=(channel_id, start, bounds[index + 1], out, stopped, cache_pages and index == 0)
+            ).start()
+            queues.append(out)
+
+        try:
+            for out in queues:
+                while True:
+                    item = out.get()
+                    if item[0] == 'message':
+                        yield item[1]
+                    elif item[0] == 'cursor':
+                        # Every earlier shard is drained, so all newer messages are handled
+                        yield Cursor('history', item[1])
+                    else:
+                        _, pages, error = item
+                        scan['history'] += pages
+                        if error is None:
+                            break
+                        if error == 403:
+                            self.on_status(f"Skipping channel {channel_name or channel_id}: No access (403)")
+                            scan['complete'] = True
+                        else:
+                            self.on_status(f"Failed to fetch messages{label}: {error}")
+                        return
+            scan['complete'] = self._is_running
+        finally:
+            stopped.set()
+
+    def oldest_message_id(self, channel_id, scan):
+        # `after` pages run oldest first, so one single-message request finds
+        # where the channel's (or the filter window's) history really begins.
+        params = {"limit": 1, "after": str(self.message_filter.min_id or 0)}
+        r = self.client.get(f"/channels/{channel_id}/messages", ROUTE_CHANNEL_MESSAGES, channel_id, params=params)
+        if r.status_code != 200 or not r.json():
+            return None
+        scan['history'] += 1
+        return int(r.json()[0]['id'])
+
+    def _scan_shard(self, channel_id, before_message_id, lower, out, stopped, cache_pages):
+        pages = 0
+        error = None
+        try:
+            while self._is_running and not stopped.is_set():
+                params = {"limit": 100}
+                if before_message_id:
+                    params["before"] = before_message_id
+                r = self.client.get(
+                    f"/channels/{channel_id}/messages", ROUTE_CHANNEL_MESSAGES, channel_id, params=params
+                )
+                if r.status_code != 200:
+                    error = r.status_code
+                    break
+
+                pages += 1
+                messages = r.json()
+                if cache_pages:
+                    self.cache.store_page(channel_id, messages, older=True, complete=lower is None and len(messages) < 100)
+                in_range = [m for m in messages if lower is None or int(m['id']) >= lower]
+                for msg in in_range:
+                    if msg['author']['id'] == self.user_id:
+                        self._put_shard_item(out, ('message', msg), stopped)
+                if len(messages) < 100 or len(in_range) < len(messages):
+                    break
+                before_message_id = messages[-1]['id']
+                self._put_shard_item(out, ('cursor', before_message_id), stopped)
+        except RequestCancelled:
+            pass
+        except Exception as e:
+            error = str(e)
+        self.client.release()
+        self._put_shard_item(out, ('end', pages, error), stopped)
+
+    def _put_shard_item(self, out, item, stopped):
+        while not stopped.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def archive_candidates(self, items, already_deleted):
+        # Runs on the discovery side of the pipeline, so archiving keeps
+        # ahead of the deletes instead of sitting between them
+        for item in items:
+            if not isinstance(item, Cursor) and item['id'] not in already_deleted:
+                if self.message_filter.matches(item):
+                    self.archive.add(item)
+            yield item
+
+    def prefetch(self, items):
+        # Producer/consumer split of a discovery generator: a thread drives
+        # it into a bounded queue, which blocks the producer once the
+        # consumer falls PREFETCH_QUEUE_SIZE items behind. Errors are re-raised
+        # on the consuming side; closing this generator stops the producer.
+        out = queue.Queue(maxsize=PREFETCH_QUEUE_SIZE)
+        stopped = threading.Event()
+
+        def produce():
+            error = None
+            try:
+                for item in items:
+                    if not self._put_shard_item(out, ('item', item), stopped):
+                        break
+            except Exception as e:
+                error = e
+            finally:
+                items.close()
+                self.client.release()
+            self._put_shard_item(out, ('end', error), stopped)
+
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while True:
+                kind, value = out.get()
+                if kind == 'end':
+                    if value is not None:
+                        raise value
+                    return
+                yield value
+        finally:
+            stopped.set()
+
+    def delete_message(self, channel_id, message_id, label=""):
+        try:
+            del_r = self.client.delete(f"/channels/{channel_id}/messages/{message_id}", ROUTE_DELETE_MESSAGE, channel_id)
+        except requests.RequestException as e:
+            self.on_status(f"Failed to delete {message_id}{label} ({type(e).__name__}), will retry")
+            return NETWORK_ERROR_STATUS
+        if del_r.status_code not in (204, 429):
+            self.on_status(f"Failed to delete {message_id}{label} ({del_r.status_code})")
+        return del_r.status_code
+
+    def stop(self):
+        self._is_running = False
+        self.rate_limiter.cancel()
@@ -0,0 +1,411 @@
+"""Local stand-in for the parts of the Discord API the deleter uses.
+
+Serves users/@me, guilds, channels, threads, message history with snowflake
+paging, deletes and search, with per-route rate-limit buckets that answer in
+Discord's shape: X-RateLimit-* headers on every response and 429s with
+`retry_after` once a bucket or the global limit is spent. Used by
+benchmark.py, and handy for trying the GUI or CLI without a real account:
+
+    python fake_discord.py --port 8765 --guilds 2 --channels 3 --messages 2000
+    DISCORD_API_BASE=http://127.0.0.1:8765/api/v9 DISCORD_TOKEN=x python cli.py --all-guilds
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DISCORD_EPOCH_MS = 1420070400000
+API_PREFIX = "/api/v9"
+USER_ID = "100000000000000001"
+OTHER_USER_ID = "100000000000000002"
+SEARCH_PAGE_SIZE = 25
+ATTACHMENT_SIZE = 64 * 1024
+
+# (limit, window in seconds) per route and major parameter. The shapes follow
+# Discord's (deletes are the tight bucket, per channel), the numbers are picked
+# so benchmarks finish in seconds rather than hours.
+DEFAULT_LIMITS = {
+    "GET /users/@me": (5, 1.0),
+    "GET /users/@me/guilds": (5, 1.0),
+    "GET /users/@me/channels": (5, 1.0),
+    "GET /guilds/{guild_id}/channels": (10, 1.0),
+    "GET /guilds/{guild_id}/threads/active": (10, 1.0),
+    "GET /channels/{channel_id}/threads/archived/public": (10, 1.0),
+    "GET /channels/{channel_id}/users/@me/threads/archived/private": (10, 1.0),
+    "GET /channels/{channel_id}/messages": (10, 1.0),
+    "DELETE /channels/{channel_id}/messages/{message_id}": (5, 1.0),
+    "GET /guilds/{guild_id}/messages/search": (10, 1.0),
+    "GET /channels/{channel_id}/messages/search": (10, 1.0),
+}
+DEFAULT_GLOBAL_LIMIT = 50  # requests per second across all routes
+
+
+def snowflake(ms, sequence=0, worker=0):
+    return ((ms - DISCORD_EPOCH_MS) << 22) | ((worker & 0x3FF) << 12) | (sequence & 0xFFF)
+
+
+class Bucket:
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def take(self, now):
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.window
+        if self.remaining == 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+class FakeDiscord:
+    """In-memory guilds, channels and messages plus the rate-limit state.
+
+    Every guild gets `channels` text channels, and `dms` DM channels are
+    added on top; each channel holds `messages` messages, one in
+    `mine_every` of them written by the fake user, and one in
+    `attachment_every` (if set) carrying a file served from /attachments/
+    without rate limits, like the CDN. Message timestamps are `spacing`
+    seconds apart and end at the current time.
+    """
+
+    def __init__(self, guilds=1, channels=3, messages=1000, dms=0, mine_every=3, spacing=60.0,
+                 attachment_every=0, limits=None, global_limit=DEFAULT_GLOBAL_LIMIT, latency=0.0):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.global_limit = global_limit
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._global_bucket = Bucket(global_limit, 1.0)
+        self.guilds = {}
+        self.channels = {}
+        self.dm_channels = []
+        self.requests = {}
+        self.rate_limited = {}
+        self.deleted = 0
+        self.attachment_every = attachment_every
+        self.attachments_served = 0
+
+        now_ms = int(time.time() * 1000)
+        next_id = iter(range(10 ** 6, 10 ** 9))
+        for g in range(guilds):
+            guild_id = str(200000000000000000 + next(next_id))
+            self.guilds[guild_id] = {"id": guild_id, "name": f"Guild {g + 1}", "channels": []}
+            for c in range(channels):
+                channel_id = str(300000000000000000 + next(next_id))
+                channel = {"id": channel_id, "name": f"channel-{c + 1}", "type": 0, "position": c, "guild_id": guild_id}
+                self.guilds[guild_id]["channels"].append(channel)
+                self._fill(channel, messages, mine_every, spacing, now_ms)
+        for d in range(dms):
+            channel_id = str(400000000000000000 + next(next_id))
+            channel = {
+                "id": channel_id, "type": 1,
+                "recipients": [{"id": OTHER_USER_ID, "username": f"friend{d + 1}", "discriminator": "0"}],
+            }
+            self.dm_channels.append(channel)
+            self._fill(channel, messages, mine_every, spacing, now_ms)
+
+    def _fill(self, channel, count, mine_every, spacing, now_ms):
+        store = {"info": channel, "ids": [], "messages": {}}
+        # Each channel gets its own worker bits, so ids stay unique across channels
+        worker = len(self.channels)
+        for i in range(count):
+            ms = now_ms - int((count - i) * spacing * 1000)
+            message_id = snowflake(ms, i, worker)
+            author = USER_ID if i % mine_every == 0 else OTHER_USER_ID
+            store["ids"].append(message_id)
+            store["messages"][message_id] = {
+                "id": str(message_id),
+                "channel_id": channel["id"],
+                "guild_id": channel.get("guild_id"),
+                "type": 0,
+                "content": f"message {i}",
+                "author": {"id": author, "username": "me" if author == USER_ID else "someone", "discriminator": "0"},
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(ms / 1000)),
+                "attachments": [],
+                "pinned": False,
+            }
+            if self.attachment_every and i % self.attachment_every == 0:
+                store["messages"][message_id]["attachments"].append({
+                    "id": str(message_id + 1), "filename": f"file {i}.bin", "size": ATTACHMENT_SIZE,
+                    "url": f"/attachments/{channel['id']}/{message_id}/file.bin",
+                })
+        self.channels[channel["id"]] = store
+
+    def my_message_count(self):
+        with self._lock:
+            return sum(
+                1 for store in self.channels.values()
+                for message in store["messages"].values() if message["author"]["id"] == USER_ID
+            )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": sum(self.requests.values()),
+                "rate_limited": sum(self.rate_limited.values()),
+                "deleted": self.deleted,
+                "attachments_served": self.attachments_served,
+                "by_route": {
+                    route: {"requests": count, "rate_limited": self.rate_limited.get(route, 0)}
+                    for route, count in self.requests.items()
+                },
+            }
+
+    def check_rate_limit(self, route, major):
+        """Returns (allowed, headers, retry_after, is_global) for one request."""
+        now = time.monotonic()
+        limit, window = self.limits.get(route, (10, 1.0))
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            if not self._global_bucket.take(now):
+                self.rate_limited[route] = self.rate_limited.get(route, 0) + 1
+                return False, {"X-RateLimit-Global": "true"}, self._global_bucket.reset_at - now, True
+            bucket = self._buckets.get((route, major))
+            if bucket is None:
+                bucket = self._buckets[(route, major)] = Bucket(limit, window)
+            allowed = bucket.take(now)
+            if not allowed:
+                self.rate_limited[route] = self.rate_limited.get(route, 0) + 1
+            reset_after = max(bucket.reset_at - now, 0.0)
+            headers = {
+                "X-RateLimit-Limit": str(bucket.limit),
+                "X-RateLimit-Remaining": str(bucket.remaining),
+                "X-RateLimit-Reset": f"{time.time() + reset_after:.3f}",
+                "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+                "X-RateLimit-Bucket": hashlib.md5(route.encode()).hexdigest()[:16],
+            }
+            return allowed, headers, reset_after, False
+
+    # Handlers return (status, body)
+
+    def get_me(self, query):
+        return 200, {"id": USER_ID, "username": "me", "discriminator": "0", "global_name": "Me"}
+
+    def get_my_guilds(self, query):
+        return 200, [{"id": g["id"], "name": g["name"]} for g in self.guilds.values()]
+
+    def get_my_channels(self, query):
+        return 200, self.dm_channels
+
+    def get_guild_channels(self, query, guild_id):
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            return 404, {"message": "Unknown Guild", "code": 10004}
+        return 200, guild["channels"]
+
+    def get_active_threads(self, query, guild_id):
+        return 200, {"threads": [], "members": []}
+
+    def get_archived_threads(self, query, channel_id):
+        return 200, {"threads": [], "members": [], "has_more": False}
+
+    def get_messages(self, query, channel_id):
+        store = self.channels.get(channel_id)
+        if store is None:
+            return 404, {"message": "Unknown Channel", "code": 10003}
+        limit = max(1, min(int(query.get("limit", 50)), 100))
+        with self._lock:
+            ids = store["ids"]
+            if "after" in query:
+                start = bisect.bisect_right(ids, int(query["after"]))
+                page = ids[start:start + limit]
+            else:
+                end = bisect.bisect_left(ids, int(query["before"])) if "before" in query else len(ids)
+                page = ids[max(0, end - limit):end]
+            return 200, [store["messages"][message_id] for message_id in reversed(page)]
+
+    def delete_message(self, query, channel_id, message_id):
+        store = self.channels.get(channel_id)
+        with self._lock:
+            message = store["messages"].get(int(message_id)) if store else None
+            if message is None:
+                return 404, {"message": "Unknown Message", "code": 10008}
+            if message["author"]["id"] != USER_ID:
+                return 403, {"message": "Missing Permissions", "code": 50013}
+            del store["messages"][int(message_id)]
+            ids = store["ids"]
+            del ids[bisect.bisect_left(ids, int(message_id))]
+            self.deleted += 1
+        return 204, None
+
+    def search_guild(self, query, guild_id):
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            return 404, {"message": "Unknown Guild", "code": 10004}
+        channel_ids = [ch["id"] for ch in guild["channels"]]
+        if "channel_id" in query:
+            channel_ids = [c for c in channel_ids if c == query["channel_id"]]
+        return self._search(query, channel_ids)
+
+    def search_channel(self, query, channel_id):
+        if channel_id not in self.channels:
+            return 404, {"message": "Unknown Channel", "code": 10003}
+        return self._search(query, [channel_id])
+
+    def _search(self, query, channel_ids):
+        author_id = query.get("author_id")
+        max_id = int(query["max_id"]) if "max_id" in query else None
+        min_id = int(query["min_id"]) if "min_id" in query else None
+        offset = int(query.get("offset", 0))
+        with self._lock:
+            hits = [
+                message for channel_id in channel_ids
+                for message_id, message in self.channels[channel_id]["messages"].items()
+                if (author_id is None or message["author"]["id"] == author_id)
+                and (max_id is None or message_id < max_id)
+                and (min_id is None or message_id > min_id)
+            ]
+        hits.sort(key=lambda message: int(message["id"]), reverse=True)
+        page = hits[offset:offset + SEARCH_PAGE_SIZE]
+        return 200, {"total_results": len(hits), "messages": [[dict(message, hit=True)] for message in page]}
+
+    def routes(self):
+        # (method, path pattern, route template, major parameter group, handler)
+        return [
+            ("GET", r"/users/@me", "GET /users/@me", None, self.get_me),
+            ("GET", r"/users/@me/guilds", "GET /users/@me/guilds", None, self.get_my_guilds),
+            ("GET", r"/users/@me/channels", "GET /users/@me/channels", None, self.get_my_channels),
+            ("GET", r"/guilds/(\d+)/channels", "GET /guilds/{guild_id}/channels", 1, self.get_guild_channels),
+            ("GET", r"/guilds/(\d+)/threads/active", "GET /guilds/{guild_id}/threads/active", 1,
+             self.get_active_threads),
+            ("GET", r"/channels/(\d+)/threads/archived/public",
+             "GET /channels/{channel_id}/threads/archived/public", 1, self.get_archived_threads),
+            ("GET", r"/channels/(\d+)/users/@me/threads/archived/private",
+             "GET /channels/{channel_id}/users/@me/threads/archived/private", 1, self.get_archived_threads),
+            ("GET", r"/channels/(\d+)/messages", "GET /channels/{channel_id}/messages", 1, self.get_messages),
+            ("DELETE", r"/channels/(\d+)/messages/(\d+)", "DELETE /channels/{channel_id}/messages/{message_id}", 1,
+             self.delete_message),
+            ("GET", r"/guilds/(\d+)/messages/search", "GET /guilds/{guild_id}/messages/search", 1, self.search_guild),
+            ("GET", r"/channels/(\d+)/messages/search", "GET /channels/{channel_id}/messages/search", 1,
+             self.search_channel),
+        ]
+
+    def serve(self, host="127.0.0.1", port=0):
+        """Starts the HTTP server on a background thread and returns it."""
+        server = FakeDiscordServer((host, port), self)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class FakeDiscordHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def send_json(self, status, body, headers=None):
+        data = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def dispatch(self, method):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else url.path
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        if path == "/_stats":
+            return self.send_json(200, fake.stats())
+        if url.path.startswith("/attachments/") and method == "GET":
+            with fake._lock:
+                fake.attachments_served += 1
+            data = b"\0" * ATTACHMENT_SIZE
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        for route_method, pattern, route, major_group, handler in self.server.routes:
+            match = pattern.fullmatch(path) if route_method == method else None
+            if match:
+                break
+        else:
+            return self.send_json(404, {"message": "404: Not Found", "code": 0})
+
+        if fake.latency:
+            time.sleep(fake.latency)
+        major = match.group(major_group) if major_group else None
+        allowed, headers, retry_after, is_global = fake.check_rate_limit(route, major)
+        if not allowed:
+            headers["Retry-After"] = str(max(1, int(retry_after + 0.999)))
+            return self.send_json(429, {
+                "message": "You are being rate limited.",
+                "retry_after": round(retry_after, 3),
+                "global": is_global,
+            }, headers)
+        status, body = handler(query, *match.groups())
+        self.send_json(status, body, headers)
+
+
+class FakeDiscordServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fake):
+        super().__init__(address, FakeDiscordHandler)
+        self.fake = fake
+        self.routes = [
+            (method, re.compile(pattern), route, major_group, handler)
+            for method, pattern, route, major_group, handler in fake.routes()
+        ]
+        # Attachment URLs are absolute, so they can only be filled in once the port is known
+        host, port = self.server_address[:2]
+        for store in fake.channels.values():
+            for message in store["messages"].values():
+                for attachment in message["attachments"]:
+                    if attachment["url"].startswith("/"):
+                        attachment["url"] = f"http://{host}:{port}{attachment['url']}"
+
+    @property
+    def api_base(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local fake Discord API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--guilds", type=int, default=1)
+    parser.add_argument("--channels", type=int, default=3, help="text channels per guild")
+    parser.add_argument("--dms", type=int, default=0, help="DM channels")
+    parser.add_argument("--messages", type=int, default=1000, help="messages per channel")
+    parser.add_argument("--mine-every", type=int, default=3, help="one message in N is the fake user's")
+    parser.add_argument("--attachment-every", type=int, default=0, help="one message in N has an attachment")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args(argv)
+
+    fake = FakeDiscord(guilds=args.guilds, channels=args.channels, messages=args.messages, dms=args.dms,
+                       mine_every=args.mine_every, attachment_every=args.attachment_every, latency=args.latency)
+    server = FakeDiscordServer((args.host, args.port), fake)
+    print(f"Serving {fake.my_message_count()} of your messages at {server.api_base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -1,161 +1,306 @@
+import os
 import sys
-import time
-import requests
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+import queue
+import logging
+import itertools
+import functools
+from collections import namedtuple, deque
+from logging.handlers import RotatingFileHandler
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal, QAbstractListModel, QModelIndex
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QLabel, QListWidget, QLineEdit,
-    QMessageBox, QProgressBar, QCheckBox, QTextEdit,
-    QSplitter, QSizePolicy, QAbstractItemView, QScrollArea
+    QPushButton, QLabel, QListWidget, QListView, QLineEdit,
+    QMessageBox, QProgressBar, QCheckBox, QPlainTextEdit,
+    QSplitter, QSizePolicy, QAbstractItemView, QScrollArea, QSpinBox
 )
 from PyQt5.QtGui import QColor, QPalette, QFont
+from engine import (
+    DeleteEngine, DiscordClient, MessageCache, ApiError, RequestCancelled, snowflake_time, format_duration,
+    DEFAULT_CHANNEL_CONCURRENCY, METRICS_PATH, ARCHIVE_PATH, list_guild_channels, discover_threads, channel_label
+)
+
+PREVIEW_SCAN_PAGES = 5
+LOG_MAX_LINES = 2000
+LOG_FLUSH_INTERVAL_MS = 100
+LOG_PATH = os.path.join(os.path.expanduser("~"), ".discord_deleter.log")
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
 
-DISCORD_API_BASE = "https://discord.com/api/v9"
 
 class MessageDeleteWorker(QThread):
-    progress = pyqtSignal(int)
     status = pyqtSignal(str)
+    metrics = pyqtSignal(object)
     finished = pyqtSignal(int)
 
-    def __init__(self, token, channel_id=None, guild_id=None, user_id=None, delete_all_channels=False):
+    def __init__(self, token, **options):
         super().__init__()
-        self.token = token
-        self.channel_id = channel_id
-        self.guild_id = guild_id
-        self.user_id = user_id
-        self.delete_all_channels = delete_all_channels
-        self.headers = {
-            "Authorization": self.token,
-        }
-        self._is_running = True
+        self.engine = DeleteEngine(
+            token, metrics_path=METRICS_PATH, on_status=self.status.emit, on_metrics=self.metrics.emit, **options
+        )
 
     def run(self):
-        total_deleted = 0
-        try:
-            if self.delete_all_channels:
-                r_channels = requests.get(f"{DISCORD_API_BASE}/guilds/{self.guild_id}/channels", headers=self.headers)
-                if r_channels.status_code != 200:
-                    self.status.emit(f"Failed to fetch guild channels: {r_channels.status_code}")
-                    self.finished.emit(total_deleted)
-                    return
-                channels = r_channels.json()
-                text_channels = [ch for ch in channels if ch['type'] == 0]
-
-                for ch_idx, channel in enumerate(text_channels, start=1):
-                    if not self._is_running:
-                        break
-                    channel_id = channel['id']
-                    self.status.emit(f"Deleting messages in channel: {channel['name']} ({ch_idx}/{len(text_channels)})")
-
-                    while self._is_running:
-                        before_message_id = None
-                        found_my_messages = False
-
-                        while self._is_running:
-                            params = {"limit": 100}
-                            if before_message_id:
-                                params["before"] = before_message_id
-
-                            r = requests.get(f"{DISCORD_API_BASE}/channels/{channel_id}/messages", headers=self.headers, params=params)
-                            if r.status_code == 403:
-                                self.status.emit(f"Skipping channel {channel['name']}: No access (403)")
-                                break
-                            if r.status_code != 200:
-                                self.status.emit(f"Failed to fetch messages in channel {channel['name']}: {r.status_code}")
-                                break
-
-                            messages = r.json()
-                            if not messages:
-                                break
-
-                            for msg in messages:
-                                before_message_id = msg['id']
-
-                                if msg['author']['id'] != self.user_id:
-                                    continue
-
-                                found_my_messages = True
-
-                                del_r = requests.delete(f"{DISCORD_API_BASE}/channels/{channel_id}/messages/{msg['id']}", headers=self.headers)
-                                if del_r.status_code == 204:
-                                    total_deleted += 1
-                                    self.status.emit(f"Deleted message {msg['id']} in {channel['name']}")
-                                    self.progress.emit(total_deleted)
-                                elif del_r.status_code == 429:
-                                    retry_after = del_r.json().get('retry_after', 1)
-                                    self.status.emit(f"Rate limited, sleeping {retry_after}s...")
-                                    time.sleep(retry_after)
-                                else:
-                                    self.status.emit(f"Failed to delete {msg['id']} ({del_r.status_code})")
-                                time.sleep(0.25)
-
-                            if len(messages) < 100:
-                                break
-
-                        if not found_my_messages:
-                            break
-
-            else:
-                if not self.channel_id:
-                    self.status.emit("No channel selected")
-                    self.finished.emit(total_deleted)
-                    return
-
-                while self._is_running:
-                    before_message_id = None
-                    found_my_messages = False
-
-                    while self._is_running:
-                        params = {"limit": 100}
-                        if before_message_id:
-                            params["before"] = before_message_id
-
-                        r = requests.get(f"{DISCORD_API_BASE}/channels/{self.channel_id}/messages", headers=self.headers, params=params)
-                        if r.status_code == 403:
-                            self.status.emit(f"Skipping channel: No access (403)")
-                            break
-                        if r.status_code != 200:
-                            self.status.emit(f"Failed to fetch messages: {r.status_code}")
-                            break
-
-                        messages = r.json()
-                        if not messages:
-                            break
-
-                        for msg in messages:
-                            before_message_id = msg['id']
-
-                            if msg['author']['id'] != self.user_id:
-                                continue
-
-                            found_my_messages = True
-
-                            del_r = requests.delete(f"{DISCORD_API_BASE}/channels/{self.channel_id}/messages/{msg['id']}", headers=self.headers)
-                            if del_r.status_code == 204:
-                                total_deleted += 1
-                                self.status.emit(f"Deleted message {msg['id']}")
-                                self.progress.emit(total_deleted)
-                            elif del_r.status_code == 429:
-                                retry_after = del_r.json().get('retry_after', 1)
-                                self.status.emit(f"Rate limited, sleeping {retry_after}s...")
-                                time.sleep(retry_after)
-                            else:
-                                self.status.emit(f"Failed to delete {msg['id']} ({del_r.status_code})")
-                            time.sleep(0.25)
-
-                        if len(messages) < 100:
-                            break
-
-                    if not found_my_messages:
-                        break
+        self.finished.emit(self.engine.run())
 
-        except Exception as e:
-            self.status.emit(f"Exception: {str(e)}")
+    def stop(self):
+        self.engine.stop()
+
+
+def fetch_login(client, cancelled=None):
+    r = client.get("/users/@me")
+    if r.status_code != 200:
+        raise ApiError(f"Failed to login: {r.status_code} {r.text}")
+    yield 'user', r.json()
+
+    r_guilds = client.get("/users/@me/guilds")
+    if r_guilds.status_code != 200:
+        raise ApiError(f"Failed to fetch guilds: {r_guilds.status_code}")
+    yield 'guilds', r_guilds.json()
+
+
+def fetch_channels(client, guild_id, cancelled=None):
+    # The guild's own channels come back in one request and are shown right
+    # away; the thread listings take a request or two per channel, so the
+    # full list follows as a second payload
+    channels, parents = list_guild_channels(client, guild_id)
+    yield sort_channels(channels, parents)
+    threads = discover_threads(client, guild_id, parents, cancelled=cancelled)
+    if threads:
+        yield sort_channels(channels + threads, parents)
+
+
+def sort_channels(channels, parents):
+    # Threads are listed under the channel they were started in
+    return sorted(
+        (dict(ch, name=channel_label(ch, parents)) for ch in channels),
+        key=lambda ch: (parents.get(ch.get('parent_id'), ch).get('position', 0), ch['name'])
+    )
+
+
+def fetch_cached_page(cache, client, channel_id, before_message_id=None, author_id=None, cancelled=None):
+    # Serve the preview from the cache, topping it up from the API only when
+    # the cached stretch runs out.
+    if before_message_id is None:
+        cache.sync(client, channel_id, cancelled)
+
+    rows = cache.read(channel_id, before_message_id, author_id)
+    for _ in range(PREVIEW_SCAN_PAGES):
+        cached = cache.channel(channel_id)
+        if len(rows) == 100 or cached['complete']:
+            break
+        if cancelled and cancelled():
+            raise RequestCancelled()
+        cache.backfill(client, channel_id)
+        cursor = rows[-1]['id'] if rows else before_message_id
+        rows += cache.read(channel_id, cursor, author_id, limit=100 - len(rows))
+
+    cached = cache.channel(channel_id)
+    if len(rows) == 100:
+        yield rows, rows[-1]['id'], True
+    else:
+        yield rows, cached['oldest_id'], not cached['complete']
+
+
+MessageRow = namedtuple('MessageRow', ['id', 'author_id', 'timestamp', 'preview'])
+
+
+class MessageListModel(QAbstractListModel):
+    """Preview rows for one channel, fetched page by page as the view scrolls.
+
+    Only a compact MessageRow is kept per message rather than the raw JSON.
+    `fetch_requested` asks the window for the page before the given cursor,
+    which is handed back through `append_page` with the next cursor.
+    """
+    fetch_requested = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.author_filter = None
+        self.before_message_id = None
+        self.has_more = False
+        self.loading = False
+        self.pages_scanned = 0
+
+    def start(self, author_filter=None):
+        self.beginResetModel()
+        self.rows = []
+        self.author_filter = author_filter
+        self.before_message_id = None
+        self.has_more = True
+        self.loading = False
+        self.pages_scanned = 0
+        self.endResetModel()
+
+    def clear(self):
+        self.start()
+        self.has_more = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return row.preview
+        if role == Qt.ToolTipRole:
+            return f"{row.id} - {snowflake_time(row.id):%Y-%m-%d %H:%M}"
+        if role == Qt.UserRole:
+            return row.id
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self.loading = True
+        self.fetch_requested.emit(self.before_message_id or "")
 
-        self.finished.emit(total_deleted)
+    def append_page(self, messages, next_cursor, has_more):
+        self.loading = False
+        self.pages_scanned += 1
+        self.before_message_id = next_cursor
+        self.has_more = has_more
 
-    def stop(self):
-        self._is_running = False
+        rows = []
+        for msg in messages:
+            content_preview = msg['content'][:70].replace("\n", " ")
+            preview = f"{msg['author']['username']}#{msg['author']['discriminator']}: {content_preview}"
+            rows.append(MessageRow(msg['id'], msg['author']['id'], msg.get('timestamp'), preview))
+
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+        else:
+            # The view only asks for more when rows arrive, so a page with
+            # none of the wanted messages has to ask for the next one itself
+            self.fetchMore()
+
+    def fetch_failed(self):
+        self.loading = False
+        self.has_more = False
+
+
+class ApiLoader(QThread):
+    """Runs the window's read-only API fetches on one background thread.
+
+    Jobs are generator functions; every value they yield is delivered to the
+    GUI thread through `loaded`. Submitting a job supersedes older jobs of the
+    same kind: queued ones are dropped, and a running one stops at its next
+    yield or as soon as its `cancelled()` check (passed to every job, and on
+    to the engine's paging loops) sees it was superseded. Running everything
+    on one thread keeps one keep-alive session.
+    """
+    loaded = pyqtSignal(str, int, object)
+    done = pyqtSignal(str, int)
+    failed = pyqtSignal(str, int, str)
+
+    def __init__(self):
+        super().__init__()
+        self._jobs = queue.Queue()
+        self._job_ids = itertools.count(1)
+        self._latest = {}
+
+    def submit(self, kind, fn, *args):
+        job_id = next(self._job_ids)
+        self._latest[kind] = job_id
+        self._jobs.put((kind, job_id, fn, args))
+        return job_id
+
+    def is_current(self, kind, job_id):
+        return self._latest.get(kind) == job_id
+
+    def is_superseded(self, kind, job_id):
+        return self._latest.get(kind) != job_id
+
+    def shutdown(self):
+        self._jobs.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            kind, job_id, fn, args = job
+            if not self.is_current(kind, job_id):
+                continue
+            cancelled = functools.partial(self.is_superseded, kind, job_id)
+            try:
+                for payload in fn(*args, cancelled=cancelled):
+                    if cancelled():
+                        break
+                    self.loaded.emit(kind, job_id, payload)
+            except RequestCancelled:
+                pass
+            except ApiError as e:
+                self.failed.emit(kind, job_id, str(e))
+            except Exception as e:
+                self.failed.emit(kind, job_id, f"Exception: {str(e)}")
+            self.done.emit(kind, job_id)
+
+
+class LogView(QPlainTextEdit):
+    """Status log whose memory and append cost stay flat on long runs.
+
+    Lines are queued and appended in one batch per timer tick, and the
+    document keeps only the newest `max_lines` blocks. With a log file set,
+    every line also goes to a rotating file on disk, which keeps the full
+    history.
+    """
+
+    def __init__(self, max_lines=LOG_MAX_LINES, parent=None):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_lines)
+        # Lines beyond max_lines would be trimmed right after the flush anyway
+        self._pending = deque(maxlen=max_lines)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(LOG_FLUSH_INTERVAL_MS)
+        self._timer.timeout.connect(self.flush)
+        self._file_log = logging.getLogger(f"{__name__}.status")
+        self._file_log.setLevel(logging.INFO)
+        self._file_log.propagate = False
+        self._file_handler = None
+
+    def set_log_file(self, path):
+        if self._file_handler:
+            self._file_log.removeHandler(self._file_handler)
+            self._file_handler.close()
+            self._file_handler = None
+        if path:
+            self._file_handler = RotatingFileHandler(
+                path, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+            )
+            self._file_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._file_log.addHandler(self._file_handler)
+
+    def append_line(self, message):
+        self._pending.append(message)
+        if self._file_handler:
+            self._file_log.info(message)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        if not self._pending:
+            return
+        scrollbar = self.verticalScrollBar()
+        follow = scrollbar.value() == scrollbar.maximum()
+        self.appendPlainText("\n".join(self._pending))
+        self._pending.clear()
+        # Only follow the tail if the user hasn't scrolled up to read
+        if follow:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def close_log_file(self):
+        self.flush()
+        self.set_log_file(None)
 
 
 class DiscordMessageDeleter(QWidget):
@@ -167,9 +312,17 @@ class DiscordMessageDeleter(QWidget):
         self.user_id = None
         self.guild_id = None
         self.channel_id = None
-        self.headers = None
+        self.client = None
         self.worker = None
         self.keep_my_messages_filter = True  # default ON cause y not
+        self.pending_token = None
+
+        self.cache = MessageCache()
+        self.loader = ApiLoader()
+        self.loader.loaded.connect(self.on_loader_loaded)
+        self.loader.done.connect(self.on_loader_done)
+        self.loader.failed.connect(self.on_loader_failed)
+        self.loader.start()
 
         self.setup_ui()
         self.apply_dark_theme()
@@ -197,7 +350,8 @@ class DiscordMessageDeleter(QWidget):
         # Guild list
         left_panel.addWidget(QLabel("Guilds"))
         self.guild_list = QListWidget()
-        self.guild_list.setSelectionMode(QAbstractItemView.SingleSelection)
+        # Several guilds can be selected for one purge
+        self.guild_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.guild_list.itemClicked.connect(self.on_guild_selected)
         self.guild_list.setMinimumWidth(250)
         left_panel.addWidget(self.guild_list)
@@ -219,10 +373,45 @@ class DiscordMessageDeleter(QWidget):
         self.filter_my_messages_checkbox = QCheckBox("Show Only My Messages")
         self.filter_my_messages_checkbox.setChecked(True)
         self.filter_my_messages_checkbox.stateChanged.connect(self.on_filter_toggle)
-        right_panel.addWidget(self.filter_my_messages_checkbox)
+
+        # How many channels a guild-wide purge works on at once
+        options_layout = QHBoxLayout()
+        options_layout.addWidget(self.filter_my_messages_checkbox)
+        self.resume_checkbox = QCheckBox("Resume Previous Run")
+        self.resume_checkbox.setToolTip("Continue each channel from the checkpoint left by an interrupted run")
+        options_layout.addWidget(self.resume_checkbox)
+        self.dry_run_checkbox = QCheckBox("Dry Run")
+        self.dry_run_checkbox.setToolTip("Only count what would be deleted and estimate how long it takes")
+        options_layout.addWidget(self.dry_run_checkbox)
+        self.include_dms_checkbox = QCheckBox("Include DMs")
+        self.include_dms_checkbox.setToolTip("Also purge your open DM and group DM channels in a guild purge")
+        options_layout.addWidget(self.include_dms_checkbox)
+        self.archive_checkbox = QCheckBox("Archive First")
+        self.archive_checkbox.setToolTip(f"Save each message to {ARCHIVE_PATH} before deleting it")
+        options_layout.addWidget(self.archive_checkbox)
+        self.archive_attachments_checkbox = QCheckBox("Save Attachments")
+        self.archive_attachments_checkbox.setToolTip("Also download the attachments of archived messages")
+        self.archive_attachments_checkbox.setEnabled(False)
+        self.archive_checkbox.toggled.connect(self.archive_attachments_checkbox.setEnabled)
+        options_layout.addWidget(self.archive_attachments_checkbox)
+        self.log_file_checkbox = QCheckBox("Log to File")
+        self.log_file_checkbox.setToolTip(f"Keep the full status log in {LOG_PATH} (rotated at 5 MB)")
+        self.log_file_checkbox.stateChanged.connect(self.on_log_file_toggle)
+        options_layout.addWidget(self.log_file_checkbox)
+        options_layout.addStretch(1)
+        options_layout.addWidget(QLabel("Parallel channels:"))
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, 16)
+        self.concurrency_spin.setValue(DEFAULT_CHANNEL_CONCURRENCY)
+        options_layout.addWidget(self.concurrency_spin)
+        right_panel.addLayout(options_layout)
 
         # Messages list
-        self.messages_list = QListWidget()
+        self.message_model = MessageListModel(self)
+        self.message_model.fetch_requested.connect(self.on_message_page_requested)
+        self.messages_list = QListView()
+        self.messages_list.setModel(self.message_model)
+        self.messages_list.setUniformItemSizes(True)
         self.messages_list.setSelectionMode(QAbstractItemView.NoSelection)
         right_panel.addWidget(self.messages_list, 4)
 
@@ -237,7 +426,7 @@ class DiscordMessageDeleter(QWidget):
         self.delete_messages_btn.clicked.connect(self.delete_messages_in_channel)
         buttons_layout.addWidget(self.delete_messages_btn)
 
-        self.delete_all_guild_btn = QPushButton("Delete My Messages in Guild")
+        self.delete_all_guild_btn = QPushButton("Delete My Messages in Selected Guilds")
         self.delete_all_guild_btn.clicked.connect(self.delete_messages_in_guild)
         buttons_layout.addWidget(self.delete_all_guild_btn)
 
@@ -254,8 +443,7 @@ class DiscordMessageDeleter(QWidget):
         right_panel.addWidget(self.progress_bar)
 
         # Status log box
-        self.status_text = QTextEdit()
-        self.status_text.setReadOnly(True)
+        self.status_text = LogView()
         self.status_text.setFixedHeight(140)
         self.status_text.setStyleSheet("background-color: #222; color: #ccc; font-family: Consolas, monospace;")
         right_panel.addWidget(self.status_text, 2)
@@ -310,8 +498,10 @@ class DiscordMessageDeleter(QWidget):
             btn.setStyleSheet(button_style)
 
     def log(self, message):
-        self.status_text.append(message)
-        self.status_text.ensureCursorVisible()
+        self.status_text.append_line(message)
+
+    def on_log_file_toggle(self, state):
+        self.status_text.set_log_file(LOG_PATH if state == Qt.Checked else None)
 
     def login(self):
         token = self.token_input.text().strip()
@@ -319,57 +509,78 @@ class DiscordMessageDeleter(QWidget):
             QMessageBox.warning(self, "Error", "Please enter a token.")
             return
 
-        self.headers = {
-            "Authorization": token,
-            "User-Agent": "DiscordBot (https://github.com/yourbot, v0.1)",
-            "Content-Type": "application/json"
-        }
+        self.client = DiscordClient(token)
+        self.pending_token = token
+        self.login_btn.setEnabled(False)
+        self.loader.submit('login', fetch_login, self.client)
 
-        r = requests.get(f"{DISCORD_API_BASE}/users/@me", headers=self.headers)
-        if r.status_code != 200:
-            QMessageBox.warning(self, "Error", f"Failed to login: {r.status_code} {r.text}")
-            return
+    def on_loader_loaded(self, kind, job_id, payload):
+        if self.loader.is_current(kind, job_id):
+            getattr(self, f"on_{kind}_loaded")(payload)
 
-        user_data = r.json()
-        self.user_id = user_data['id']
-        self.token = token
-        self.log(f"Logged in as {user_data['username']}#{user_data['discriminator']} (ID: {self.user_id})")
+    def on_loader_done(self, kind, job_id):
+        if not self.loader.is_current(kind, job_id):
+            return
+        if kind == 'login':
+            self.login_btn.setEnabled(self.worker is None)
+        elif kind == 'messages' and not self.message_model.has_more:
+            self.log(f"Loaded {self.message_model.rowCount()} messages from channel.")
 
-        r_guilds = requests.get(f"{DISCORD_API_BASE}/users/@me/guilds", headers=self.headers)
-        if r_guilds.status_code != 200:
-            QMessageBox.warning(self, "Error", f"Failed to fetch guilds: {r_guilds.status_code}")
+    def on_loader_failed(self, kind, job_id, message):
+        if not self.loader.is_current(kind, job_id):
+            return
+        if kind == 'messages':
+            self.message_model.fetch_failed()
+            self.log(message)
+        else:
+            QMessageBox.warning(self, "Error", message)
+
+    def on_login_loaded(self, payload):
+        part, data = payload
+        if part == 'user':
+            self.user_id = data['id']
+            self.token = self.pending_token
+            self.log(f"Logged in as {data['username']}#{data['discriminator']} (ID: {self.user_id})")
             return
+
         self.guild_list.clear()
-        self.guilds = r_guilds.json()
+        self.guilds = data
         for g in self.guilds:
             item_text = f"{g['name']}"
             self.guild_list.addItem(item_text)
 
         self.channel_list.clear()
-        self.messages_list.clear()
+        self.message_model.clear()
 
     def on_guild_selected(self, item):
         guild_name = item.text()
         guild = next((g for g in self.guilds if g['name'] == guild_name), None)
         if guild:
             self.guild_id = guild['id']
+            # A channel picked in the previous guild must not be purged against this guild's search index
+            self.channel_id = None
             self.load_channels(guild['id'])
             self.channel_list.setCurrentRow(-1)
-            self.messages_list.clear()
+            self.message_model.clear()
 
     def load_channels(self, guild_id):
-        r = requests.get(f"{DISCORD_API_BASE}/guilds/{guild_id}/channels", headers=self.headers)
-        if r.status_code != 200:
-            QMessageBox.warning(self, "Error", f"Failed to fetch channels: {r.status_code}")
-            return
         self.channel_list.clear()
-        self.channels = [ch for ch in r.json() if ch['type'] == 0]
-        for ch in self.channels:
+        self.channels = []
+        self.loader.submit('channels', fetch_channels, self.client, guild_id)
+
+    def on_channels_loaded(self, channels):
+        # Called again once the threads are listed; a channel picked in the
+        # meantime stays selected
+        self.channel_list.clear()
+        self.channels = channels
+        for row, ch in enumerate(self.channels):
             self.channel_list.addItem(ch['name'])
+            if ch['id'] == self.channel_id:
+                self.channel_list.setCurrentRow(row)
 
     def on_channel_selected(self, item):
-        channel_name = item.text()
-        channel = next((ch for ch in self.channels if ch['name'] == channel_name), None)
+        row = self.channel_list.row(item)
+        channel = self.channels[row] if 0 <= row < len(self.channels) else None
         if channel:
             self.channel_id = channel['id']
             self.load_messages(channel['id'])
@@ -386,49 +597,17 @@ class DiscordMessageDeleter(QWidget):
         self.load_messages(self.channel_id)
 
     def load_messages(self, channel_id):
-        self.messages_list.clear()
-
-        before_message_id = None
-        all_messages = []
-        max_fetch = 500
-        fetched = 0
-
-        while True:
-            params = {"limit": 100}
-            if before_message_id:
-                params["before"] = before_message_id
-
-            r = requests.get(f"{DISCORD_API_BASE}/channels/{channel_id}/messages", headers=self.headers, params=params)
-            if r.status_code == 403:
-                self.log(f"Failed to fetch messages for channel {channel_id}: 403 (No access)")
-                break
-            if r.status_code != 200:
-                self.log(f"Failed to fetch messages: {r.status_code}")
-                break
-
-            messages = r.json()
-            if not messages:
-                break
+        self.message_model.start(self.user_id if self.keep_my_messages_filter else None)
+        self.message_model.fetchMore()
 
-            all_messages.extend(messages)
-            fetched += len(messages)
-            before_message_id = messages[-1]['id']
-
-            if fetched >= max_fetch:
-                break
-
-            if len(messages) < 100:
-                break
-
-        if self.keep_my_messages_filter:
-            all_messages = [m for m in all_messages if m['author']['id'] == self.user_id]
-
-        for msg in all_messages:
-            content_preview = msg['content'][:70].replace("\n", " ")
-            display_text = f"{msg['author']['username']}#{msg['author']['discriminator']}: {content_preview}"
-            self.messages_list.addItem(display_text)
+    def on_message_page_requested(self, before_message_id):
+        self.loader.submit(
+            'messages', fetch_cached_page, self.cache, self.client, self.channel_id,
+            before_message_id or None, self.message_model.author_filter
+        )
 
-        self.log(f"Loaded {len(all_messages)} messages from channel.")
+    def on_messages_loaded(self, page):
+        self.message_model.append_page(*page)
 
     def delete_messages_in_channel(self):
         if not self.token or not self.channel_id or not self.user_id:
@@ -437,26 +616,35 @@ class DiscordMessageDeleter(QWidget):
         self.start_deletion(delete_all_channels=False)
 
     def delete_messages_in_guild(self):
-        if not self.token or not self.guild_id or not self.user_id:
+        guild_ids = [self.guilds[self.guild_list.row(item)]['id'] for item in self.guild_list.selectedItems()]
+        include_dms = self.include_dms_checkbox.isChecked()
+        if not self.token or not self.user_id or not (guild_ids or include_dms):
             QMessageBox.warning(self, "Error", "Login and select a guild first.")
             return
-        self.start_deletion(delete_all_channels=True)
+        self.start_deletion(delete_all_channels=True, guild_ids=guild_ids, include_dms=include_dms)
 
-    def start_deletion(self, delete_all_channels):
+    def start_deletion(self, delete_all_channels, guild_ids=None, include_dms=False):
         self.disable_controls(True)
         self.progress_bar.setVisible(True)
         self.progress_bar.setMaximum(0)
         self.progress_bar.setValue(0)
+        self.progress_bar.resetFormat()
         self.log("Starting deletion process...")
 
         self.worker = MessageDeleteWorker(
             token=self.token,
-            channel_id=self.channel_id,
+            channel_id=None if delete_all_channels else self.channel_id,
             guild_id=self.guild_id,
             user_id=self.user_id,
-            delete_all_channels=delete_all_channels
+            guild_ids=guild_ids,
+            include_dms=include_dms,
+            concurrency=self.concurrency_spin.value(),
+            resume=self.resume_checkbox.isChecked(),
+            dry_run=self.dry_run_checkbox.isChecked(),
+            archive_path=ARCHIVE_PATH if self.archive_checkbox.isChecked() else None,
+            archive_attachments=self.archive_attachments_checkbox.isChecked()
         )
-        self.worker.progress.connect(self.on_progress_update)
+        self.worker.metrics.connect(self.on_metrics_update)
         self.worker.status.connect(self.log)
         self.worker.finished.connect(self.on_deletion_finished)
         self.worker.start()
@@ -467,10 +655,26 @@ class DiscordMessageDeleter(QWidget):
             self.log("Stop requested, waiting for current operation to finish...")
             self.stop_btn.setEnabled(False)
 
-    def on_progress_update(self, count):
-        if self.progress_bar.maximum() == 0:
-            self.progress_bar.setMaximum(1000)
-        self.progress_bar.setValue(min(count, 1000))
+    def on_metrics_update(self, metrics):
+        # Multi-channel runs count finished channels, single channels count
+        # handled messages out of the candidates found so far
+        if metrics['channels_total'] > 1:
+            done, total, unit = metrics['channels_done'], metrics['channels_total'], "channels"
+        else:
+            done, total, unit = metrics['deleted'] + metrics['failed'], metrics['candidates'], "messages"
+        if total == 0:
+            return
+        if self.worker and self.worker.engine.dry_run:
+            self.progress_bar.setMaximum(total)
+            self.progress_bar.setValue(done if unit == "channels" else total)
+            self.progress_bar.setFormat(f"Dry run - {metrics['candidates']} message(s) would be deleted")
+            return
+        eta = format_duration(metrics['eta']) if metrics['eta'] is not None else "estimating"
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(min(done, total))
+        self.progress_bar.setFormat(
+            f"%v/%m {unit} - {metrics['deleted']} deleted - {metrics['rate']:.1f} msg/s - ETA {eta}"
+        )
 
     def on_deletion_finished(self, total_deleted):
         self.log(f"Deletion finished. Total messages deleted: {total_deleted}")
@@ -478,6 +682,15 @@ class DiscordMessageDeleter(QWidget):
         self.progress_bar.setVisible(False)
         self.worker = None
 
+    def closeEvent(self, event):
+        if self.worker:
+            self.worker.stop()
+            self.worker.wait()
+        self.loader.shutdown()
+        self.cache.close()
+        self.status_text.close_log_file()
+        super().closeEvent(event)
+
     def disable_controls(self, disable):
         self.login_btn.setEnabled(not disable)
         self.guild_list.setEnabled(not disable)
@@ -487,6 +700,11 @@ class DiscordMessageDeleter(QWidget):
         self.delete_all_guild_btn.setEnabled(not disable)
         self.stop_btn.setEnabled(disable)
         self.filter_my_messages_checkbox.setEnabled(not disable)
+        self.concurrency_spin.setEnabled(not disable)
+        self.resume_checkbox.setEnabled(not disable)
+        self.dry_run_checkbox.setEnabled(not disable)
+        self.archive_checkbox.setEnabled(not disable)
+        self.archive_attachments_checkbox.setEnabled(not disable and self.archive_checkbox.isChecked())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+"""RateLimiter tests against a local HTTP server that returns scripted rate-limit headers.
+
+    python -m pytest test_rate_limiter.py
+    python -m unittest test_rate_limiter
+"""
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import engine
+from engine import DiscordClient, RateLimiter, ROUTE_DELETE_MESSAGE
+
+# Scheduling slack: waits are checked against the scripted reset times minus this
+TOLERANCE = 0.05
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def handle_one(self):
+        server = self.server
+        with server.lock:
+            server.received.append((self.command, self.path, time.monotonic()))
+            script = server.scripts.get((self.command, self.path))
+            status, headers, body = script.pop(0) if script else (200, {}, {})
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, str(value))
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_DELETE = handle_one
+
+
+class ScriptedServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ScriptedHandler)
+        self.lock = threading.Lock()
+        self.scripts = {}
+        self.received = []
+
+    def script(self, method, path, *responses):
+        self.scripts[(method, path)] = list(responses)
+
+    def arrivals(self, method, path):
+        with self.lock:
+            return [at for m, p, at in self.received if (m, p) == (method, path)]
+
+
+def bucket(limit, remaining, reset_after, name="bucket"):
+    return {
+        "X-RateLimit-Limit": limit,
+        "X-RateLimit-Remaining": remaining,
+        "X-RateLimit-Reset-After": reset_after,
+        "X-RateLimit-Bucket": name,
+    }
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ScriptedServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_base = engine.DISCORD_API_BASE
+        engine.DISCORD_API_BASE = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.limiter = RateLimiter()
+        self.client = DiscordClient("test-token", self.limiter)
+
+    def tearDown(self):
+        self.client.close()
+        engine.DISCORD_API_BASE = self.api_base
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_waits_for_spent_bucket_to_reset(self):
+        self.server.script("GET", "/channels/1/messages", (200, bucket(1, 0, 0.4), []), (200, bucket(1, 0, 0.4), []))
+        self.client.get("/channels/1/messages", engine.ROUTE_CHANNEL_MESSAGES, "1")
+        self.client.get("/channels/1/messages", engine.ROUTE_CHANNEL_MESSAGES, "1")
+
+        first, second = self.server.arrivals("GET", "/channels/1/messages")
+        self.assertGreaterEqual(second - first, 0.4 - TOLERANCE)
+        self.assertGreater(self.limiter.sleep_time, 0)
+
+    def test_requests_within_bucket_are_not_delayed(self):
+        self.server.script("GET", "/channels/1/messages", (200, bucket(5, 4, 2.0), []))
+        started = time.monotonic()
+        for _ in range(3):
+            self.client.get("/channels/1/messages", engine.ROUTE_CHANNEL_MESSAGES, "1")
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(self.limiter.sleep_time, 0)
+
+    def test_resends_request_answered_with_429(self):
+        self.server.script(
+            "DELETE", "/channels/1/messages/10",
+            (429, bucket(1, 0, 0.3, "delete"), {"retry_after": 0.3, "global": False}),
+            (204, bucket(1, 0, 0.3, "delete"), {}),
+        )
+        r = self.client.delete("/channels/1/messages/10", ROUTE_DELETE_MESSAGE, "1")
+
+        self.assertEqual(r.status_code, 204)
+        first, second = self.server.arrivals("DELETE", "/channels/1/messages/10")
+        self.assertGreaterEqual(second - first, 0.3 - TOLERANCE)
+        self.assertEqual(self.limiter.rate_limited, 1)
+
+    def test_gives_up_after_max_attempts(self):
+        limited = (429, {}, {"retry_after": 0.01, "global": False})
+        self.server.script("GET", "/channels/1/messages", *[limited] * engine.MAX_RATE_LIMIT_ATTEMPTS)
+        r = self.client.get("/channels/1/messages", engine.ROUTE_CHANNEL_MESSAGES, "1")
+
+        self.assertEqual(r.status_code, 429)
+        self.assertEqual(len(self.server.arrivals("GET", "/channels/1/messages")), engine.MAX_RATE_LIMIT_ATTEMPTS)
+
+    def test_global_limit_pauses_every_route(self):
+        self.server.script(
+            "GET", "/users/@me/guilds",
+            (429, {"X-RateLimit-Global": "true"}, {"retry_after": 0.5, "global": True}),
+        )
+        limited = threading.Thread(target=self.client.get, args=("/users/@me/guilds",))
+        limited.start()
+        deadline = time.monotonic() + 5
+        while self.limiter.rate_limited == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.client.get("/channels/2/messages", engine.ROUTE_CHANNEL_MESSAGES, "2")
+        limited.join()
+
+        (limited_at, retried_at), = [self.server.arrivals("GET", "/users/@me/guilds")]
+        other_at, = self.server.arrivals("GET", "/channels/2/messages")
+        self.assertGreaterEqual(other_at - limited_at, 0.5 - TOLERANCE)
+        self.assertGreaterEqual(retried_at - limited_at, 0.5 - TOLERANCE)
+
+    def test_major_parameters_have_separate_buckets(self):
+        for channel in ("1", "2"):
+            self.server.script(
+                "DELETE", f"/channels/{channel}/messages/10",
+                (204, bucket(1, 0, 0.5, "delete"), {}), (204, bucket(1, 0, 0.5, "delete"), {}),
+            )
+        self.client.delete("/channels/1/messages/10", ROUTE_DELETE_MESSAGE, "1")
+        self.client.delete("/channels/2/messages/10", ROUTE_DELETE_MESSAGE, "2")
+        self.client.delete("/channels/1/messages/10", ROUTE_DELETE_MESSAGE, "1")
+
+        first, again = self.server.arrivals("DELETE", "/channels/1/messages/10")
+        other, = self.server.arrivals("DELETE", "/channels/2/messages/10")
+        # Channel 2 has its own bucket, channel 1's second delete waits for its reset
+        self.assertLess(other - first, 0.5 - TOLERANCE)
+        self.assertGreaterEqual(again - first, 0.5 - TOLERANCE)
+
+    def test_cancel_wakes_waiting_request(self):
+        self.server.script("GET", "/channels/1/messages", (200, bucket(1, 0, 30.0), []))
+        self.client.get("/channels/1/messages", engine.ROUTE_CHANNEL_MESSAGES, "1")
+        threading.Timer(0.1, self.limiter.cancel).start()
+        started = time.monotonic()
+        with self.assertRaises(engine.RequestCancelled):
+            self.client.get("/channels/1/messages", engine.ROUTE_CHANNEL_MESSAGES, "1")
+        self.assertLess(time.monotonic() - started, 5)
+        # Only the time actually waited counts, not the 30s the bucket asked for
+        self.assertLess(self.limiter.sleep_time, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()